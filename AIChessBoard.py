@@ -6,16 +6,20 @@ import random
 import math
 import time
 import chess.pgn
-from collections import defaultdict
 from functools import lru_cache
 import json
+import threading
+import numpy as np
+from multiprocessing import Pool, RawValue
+from transposition_table import TranspositionTable, zobrist_key, EXACT, LOWERBOUND, UPPERBOUND
+from incremental_evaluation import IncrementalEvaluator
+from bitboard_evaluation import evaluate_board_bitboard, PIECE_VALUE_NAMES
+from opening_book import load_opening_book, OPENING_BOOK_FILE
 
-#Initialization of pygame
-pygame.init()
 BOARD_WIDTH, HEIGHT = 640, 640 #The chessboard occupies 480x640 (8 squares of 60x60)
 SIDEBAR_WIDTH = 320
 TOTAL_WIDTH = BOARD_WIDTH + SIDEBAR_WIDTH
-SCREEN = pygame.display.set_mode((TOTAL_WIDTH, HEIGHT), pygame.RESIZABLE | pygame.SHOWN)
+SCREEN = None  #Window, opened by init_display
 fullscreen_mode = False  #Fullscreen mode indicator
 
 #Colors
@@ -28,7 +32,15 @@ TEXT_COLOR = (0, 0, 0)
 #Load piece images
 IMAGES = {}
 PIECES = ['wp', 'bp', 'wr', 'br', 'wn', 'bn', 'wb', 'bb', 'wq', 'bq', 'wk', 'bk']
-pygame.display.set_caption("Jeu d'échecs")
+
+# -- Function to initialize pygame and open the window --
+#Called by main, not at import: on Windows and macOS, the processes of the parallel search import this module again,
+#and must not open a window each.
+def init_display():
+    global SCREEN
+    pygame.init()
+    SCREEN = pygame.display.set_mode((TOTAL_WIDTH, HEIGHT), pygame.RESIZABLE | pygame.SHOWN)
+    pygame.display.set_caption("Jeu d'échecs")
 
 # -- Function to toggle fullscreen and resize --
 def toggle_fullscreen():
@@ -52,6 +64,7 @@ def toggle_fullscreen():
     #Resize the pieces
     for piece, image in IMAGES.items():
         IMAGES[piece] = pygame.transform.scale(image, (BOARD_WIDTH // 8, HEIGHT // 8))
+    renderer.invalidate()
 
 # -- Function to load images --
 def load_images():
@@ -62,70 +75,69 @@ def load_images():
         IMAGES[piece] = pygame.transform.scale(
             pygame.image.load(full_path), (BOARD_WIDTH // 8, HEIGHT // 8))
 
+# -- Function that returns the rectangle of a square on the screen --
+def square_rect(square):
+    col = chess.square_file(square)
+    row = 7 - chess.square_rank(square)
+    return pygame.Rect(col * BOARD_WIDTH // 8, row * HEIGHT // 8, BOARD_WIDTH // 8, HEIGHT // 8)
+
+# -- Function to draw one square: color, highlights, coordinates and piece --
+#Everything drawn for a square stays inside the square, so a square can be drawn again without the rest of the board.
+def draw_square(square, piece=None, selected=False, target=False, check=False, checkmate=False):
+    c = chess.square_file(square)
+    r = 7 - chess.square_rank(square)
+    rect = square_rect(square)
+    pygame.draw.rect(SCREEN, [WHITE, BLUE][(r + c) % 2], rect)
+
+    #Highlight the selected square
+    if selected:
+        transparent_surface = pygame.Surface((BOARD_WIDTH // 8, HEIGHT // 8), pygame.SRCALPHA)
+        transparent_surface.fill(SELECTED_COLOR)  #Apply color with transparency
+        SCREEN.blit(transparent_surface, rect.topleft)  #Display the surface at the correct position
+
+    #Highlight accessible squares
+    if target:
+        radius = BOARD_WIDTH // 48  #Circle size
+        #Create a surface with transparency (RGBA)
+        circle_surface = pygame.Surface((BOARD_WIDTH // 8, HEIGHT // 8), pygame.SRCALPHA)  #Transparent surface
+        pygame.draw.circle(circle_surface, (100, 100, 100, 150), (BOARD_WIDTH // 16, HEIGHT // 16), radius)
+        #Blit the surface onto the main screen
+        SCREEN.blit(circle_surface, rect.topleft)
+
+    #Display letters and numbers, color opposite to the square
+    text_color = WHITE if (r + c) % 2 == 1 else BLUE
+    #Display numbers on the first column (on the left)
+    if c == 0:
+        number_text = render_text(str(8 - r), 20, text_color)
+        SCREEN.blit(number_text, (rect.x + 2, rect.y + 2))
+    #Display letters on the last rank (at the bottom)
+    if r == 7:
+        letter_text = render_text(chr(ord('a') + c), 20, text_color)
+        text_rect = letter_text.get_rect(bottomright=(rect.right - 2, rect.bottom - 2))
+        SCREEN.blit(letter_text, text_rect)
+
+    if check:
+        transparent_surface = pygame.Surface((BOARD_WIDTH // 8, HEIGHT // 8), pygame.SRCALPHA)
+        transparent_surface.fill((255, 0, 0, 100)) #Transparent red
+        SCREEN.blit(transparent_surface, rect.topleft)
+    if checkmate:
+        transparent_surface = pygame.Surface((BOARD_WIDTH // 8, HEIGHT // 8), pygame.SRCALPHA)
+        transparent_surface.fill((0, 0, 0, 100)) #Transparent black
+        SCREEN.blit(transparent_surface, rect.topleft)
+
+    if piece:
+        piece_str = piece.symbol()
+        img_key = ('w' if piece_str.isupper() else 'b') + piece_str.lower()
+        SCREEN.blit(IMAGES[img_key], rect)
+
 # -- Function to draw the chessboard --
 def draw_board(selected_square=None, legal_moves=[], board=None):
-    colors = [WHITE, BLUE]
-    for r in range(8):
-        for c in range(8):
-            color = colors[(r + c) % 2]
-            rect = pygame.Rect(c * BOARD_WIDTH // 8, r * HEIGHT // 8, BOARD_WIDTH // 8, HEIGHT // 8)
-            pygame.draw.rect(SCREEN, color, rect)
-
-            #Highlight the selected square
-            if selected_square is not None:
-                sel_col = chess.square_file(selected_square)
-                sel_row = 7 - chess.square_rank(selected_square)
-                if c == sel_col and r == sel_row:
-                    transparent_surface = pygame.Surface((BOARD_WIDTH // 8, HEIGHT // 8), pygame.SRCALPHA)
-                    transparent_surface.fill(SELECTED_COLOR)  #Apply color with transparency
-                    SCREEN.blit(transparent_surface, rect.topleft)  #Display the surface at the correct position
-
-            #Highlight accessible squares
-            for move in legal_moves:
-                target_col = chess.square_file(move.to_square)
-                target_row = 7 - chess.square_rank(move.to_square)
-                if c == target_col and r == target_row:
-                    center_x = c * BOARD_WIDTH // 8 + (BOARD_WIDTH // 16)
-                    center_y = r * HEIGHT // 8 + (HEIGHT // 16)
-                    radius = BOARD_WIDTH // 48  #Circle size
-                    #Create a surface with transparency (RGBA)
-                    circle_surface = pygame.Surface((BOARD_WIDTH // 8, HEIGHT // 8), pygame.SRCALPHA)  #Transparent surface
-                    pygame.draw.circle(circle_surface, (100, 100, 100, 150), (BOARD_WIDTH // 16, HEIGHT // 16), radius)
-                    #Blit the surface onto the main screen
-                    SCREEN.blit(circle_surface, (c * BOARD_WIDTH // 8, r * HEIGHT // 8))
-        #Display letters and numbers
-        font = pygame.font.Font(None, 20)
-        for r in range(8):
-            for c in range(8):
-            #Color opposite to the square
-                text_color = WHITE if (r + c) % 2 == 1 else BLUE
-                rect = pygame.Rect(c * BOARD_WIDTH // 8, r * HEIGHT // 8, BOARD_WIDTH // 8, HEIGHT // 8)
-                #Display numbers on the first column (on the left)
-                if c == 0:
-                    number_text = font.render(str(8 - r), True, text_color)
-                    SCREEN.blit(number_text, (rect.x + 2, rect.y + 2))
-                #Display letters on the last rank (at the bottom)
-                if r == 7:
-                    letter_text = font.render(chr(ord('a') + c), True, text_color)
-                    text_rect = letter_text.get_rect(bottomright=(rect.right - 2, rect.bottom - 2))
-                    SCREEN.blit(letter_text, text_rect)
-
-    if board:
-        if board.is_check():
-            king_square = board.king(board.turn)
-            king_col = chess.square_file(king_square)
-            king_row = 7 - chess.square_rank(king_square)
-            transparent_surface = pygame.Surface((BOARD_WIDTH // 8, HEIGHT // 8), pygame.SRCALPHA)
-            transparent_surface.fill((255, 0, 0, 100)) #Transparent red
-            SCREEN.blit(transparent_surface, (king_col * BOARD_WIDTH // 8, king_row * HEIGHT // 8))
-        if board.is_checkmate():
-            king_square = board.king(board.turn)
-            king_col = chess.square_file(king_square)
-            king_row = 7 - chess.square_rank(king_square)
-            transparent_surface = pygame.Surface((BOARD_WIDTH // 8, HEIGHT // 8), pygame.SRCALPHA)
-            transparent_surface.fill((0, 0, 0, 100)) #Transparent black
-            SCREEN.blit(transparent_surface, (king_col * BOARD_WIDTH // 8, king_row * HEIGHT // 8))
-                      
+    targets = {move.to_square for move in legal_moves}
+    check_square = board.king(board.turn) if board and board.is_check() else None
+    checkmate = check_square is not None and board.is_checkmate()
+    for square in chess.SQUARES:
+        draw_square(square, None, square == selected_square, square in targets, square == check_square, checkmate and square == check_square)
+
 # -- Function to draw the pieces --
 def draw_pieces(board):
     for square in chess.SQUARES:
@@ -137,24 +149,53 @@ def draw_pieces(board):
             img_key = ('w' if piece_str.isupper() else 'b') + piece_str.lower()
             SCREEN.blit(IMAGES[img_key], pygame.Rect(col * BOARD_WIDTH // 8, row * HEIGHT // 8, BOARD_WIDTH // 8, HEIGHT // 8))
 
-# -- Function to draw sidebar --
-def draw_sidebar(move_history, scroll_offset):
+# -- Functions that keep the fonts and the rendered texts of the sidebar between frames --
+#The texts of the move list only change when a move is played: rendering them again at each frame is wasted time.
+@lru_cache(maxsize=None)
+def get_font(size):
+    return pygame.font.Font(None, size)
+
+@lru_cache(maxsize=4096)
+def render_text(text, size, color, italic=False):
+    font = get_font(size)
+    font.set_italic(italic)
+    surface = font.render(text, True, color)
+    font.set_italic(False)
+    return surface
+
+#Largest font size (starting from 100) at which the title fits in the target width
+@lru_cache(maxsize=None)
+def title_font_size(title_text, target_width):
+    size = 100
+    while get_font(size).size(title_text)[0] > target_width:
+        size = get_font(size).get_height() - 1
+    return size
+
+MOVE_LIST_TOP = 45  #Position of the first line of the move list
+MOVE_LINE_HEIGHT = 30
+SCROLL_AREA_BG = (45, 45, 45)
+
+# -- Function that returns the scroll area of the move list --
+def get_scroll_area_rect():
+    #Calculate space reserved for buttons
+    button_height = 40
+    button_padding = 10
+    reserved_for_buttons = button_height + button_padding + 10
+    return pygame.Rect(BOARD_WIDTH + 5, 40, SIDEBAR_WIDTH - 10, HEIGHT - 45 - reserved_for_buttons)
+
+# -- Function to draw the background of the sidebar: title, separator line and empty scroll area --
+def draw_sidebar_frame():
     sidebar_rect = pygame.Rect(BOARD_WIDTH, 0, SIDEBAR_WIDTH, HEIGHT)
     pygame.draw.rect(SCREEN, SIDEBAR_BG, sidebar_rect)
 
     #Calculate the target width for the title and the separator line
     target_width = int(SIDEBAR_WIDTH * (0.6 if fullscreen_mode else 0.85))
 
-    #Adjust font size for the title
-    title_font = pygame.font.Font(None, 100)  #Large initial size
+    #Font size of the title: reduced until the width matches the target
     title_text = "History of moves played"
-    
-    #Reduce font size until the width matches the target
-    while title_font.size(title_text)[0] > target_width:
-        title_font = pygame.font.Font(None, title_font.get_height() - 1)
 
     #Center the text and display it
-    title_surface = title_font.render(title_text, True, (225, 225, 225))
+    title_surface = render_text(title_text, title_font_size(title_text, target_width), (225, 225, 225))
     title_x = BOARD_WIDTH + (SIDEBAR_WIDTH - title_surface.get_width()) // 2
     SCREEN.blit(title_surface, (title_x, 5))
 
@@ -163,62 +204,54 @@ def draw_sidebar(move_history, scroll_offset):
     line_end_x = line_start_x + target_width
     pygame.draw.line(SCREEN, (220, 220, 220), (line_start_x, 35), (line_end_x, 35), 2)
 
-    #Calculate space reserved for buttons
-    button_height = 40
-    button_padding = 10
-    reserved_for_buttons = button_height + button_padding + 10
-
     #Scroll area
-    scroll_area_rect = pygame.Rect(BOARD_WIDTH + 5, 40, SIDEBAR_WIDTH - 10, HEIGHT - 45 - reserved_for_buttons)
-    pygame.draw.rect(SCREEN, (45, 45, 45), scroll_area_rect)
+    scroll_area_rect = get_scroll_area_rect()
+    pygame.draw.rect(SCREEN, SCROLL_AREA_BG, scroll_area_rect)
+    return scroll_area_rect
 
-    #Display the moves
-    font = pygame.font.Font(None, 28)
-    y_offset = 45
-    line_height = 30
-    num_area_width = 50
-
-    for i in range(0, len(move_history), 2):
-        draw_y = y_offset - scroll_offset
-
-        if scroll_area_rect.top <= draw_y < scroll_area_rect.bottom:
-            num_rect_full = pygame.Rect(BOARD_WIDTH + 5, draw_y, num_area_width, line_height)
-            pygame.draw.rect(SCREEN, SIDEBAR_BG, num_rect_full)
+# -- Function that returns the lines of the move list inside the scroll area, as (line number, y position) --
+#Only these lines are drawn: the cost of a frame does not depend on the length of the game.
+def visible_move_lines(move_history, scroll_offset, scroll_area_rect):
+    total_lines = (len(move_history) + 1) // 2
+    first_line = max(0, -(-(scroll_area_rect.top - MOVE_LIST_TOP + scroll_offset) // MOVE_LINE_HEIGHT))
+    for line in range(first_line, total_lines):
+        draw_y = MOVE_LIST_TOP + line * MOVE_LINE_HEIGHT - scroll_offset
+        if draw_y >= scroll_area_rect.bottom:
+            break
+        yield line, draw_y
 
-            num_text = f"{i // 2 + 1}"
-            font.set_italic(True)
-            num_surface = font.render(num_text, True, (160, 160, 160))
-            num_text_rect = num_surface.get_rect(center=num_rect_full.center)
-            SCREEN.blit(num_surface, num_text_rect.topleft)
+# -- Function to draw a line of the move list (move_history is the list of the moves in SAN) --
+def draw_move_line(move_history, line, draw_y):
+    num_area_width = 50
+    i = 2 * line
 
-            #Space for white and black moves
-            remaining_space = SIDEBAR_WIDTH - (num_area_width + 15)
-            white_x = BOARD_WIDTH + 5 + num_area_width + 10
-            black_x = white_x + (remaining_space // 2)
+    num_rect_full = pygame.Rect(BOARD_WIDTH + 5, draw_y, num_area_width, MOVE_LINE_HEIGHT)
+    pygame.draw.rect(SCREEN, SIDEBAR_BG, num_rect_full)
 
-            #Show the moves
-            white_move_text = move_history[i]
-            white_surface = font.render(white_move_text, True, (225, 225, 225))
-            SCREEN.blit(white_surface, (white_x, draw_y + 5))
+    num_surface = render_text(f"{line + 1}", 28, (160, 160, 160), True)
+    num_text_rect = num_surface.get_rect(center=num_rect_full.center)
+    SCREEN.blit(num_surface, num_text_rect.topleft)
 
-            if i + 1 < len(move_history):
-                black_move_text = move_history[i + 1]
-                black_surface = font.render(black_move_text, True, (225, 225, 225))
-                SCREEN.blit(black_surface, (black_x, draw_y + 5))
+    #Space for white and black moves
+    remaining_space = SIDEBAR_WIDTH - (num_area_width + 15)
+    white_x = BOARD_WIDTH + 5 + num_area_width + 10
+    black_x = white_x + (remaining_space // 2)
 
-        y_offset += line_height
+    #Show the moves
+    SCREEN.blit(render_text(move_history[i], 28, (225, 225, 225), True), (white_x, draw_y + 5))
+    if i + 1 < len(move_history):
+        SCREEN.blit(render_text(move_history[i + 1], 28, (225, 225, 225), True), (black_x, draw_y + 5))
 
+# -- Function that returns the rectangle of the scrollbar (None if the whole move list fits in the scroll area) --
+def get_scrollbar_rect(move_history, scroll_offset, scroll_area_rect):
     total_lines = (len(move_history) + 1) // 2
-    content_height = total_lines * line_height
+    content_height = total_lines * MOVE_LINE_HEIGHT
 
     if content_height > scroll_area_rect.height:
         scrollbar_height = scroll_area_rect.height * scroll_area_rect.height // content_height
         scrollbar_pos = scroll_offset * scroll_area_rect.height // content_height
-        scrollbar_rect = pygame.Rect(BOARD_WIDTH + SIDEBAR_WIDTH - 15, scroll_area_rect.top + scrollbar_pos, 10, scrollbar_height)
-        pygame.draw.rect(SCREEN, (100, 100, 100), scrollbar_rect)
-        return scrollbar_rect, scroll_area_rect
-    else:
-        return None, scroll_area_rect
+        return pygame.Rect(BOARD_WIDTH + SIDEBAR_WIDTH - 15, scroll_area_rect.top + scrollbar_pos, 10, scrollbar_height)
+    return None
 
 # -- Function to animate piece movement --
 def animate_move(board, move, reverse=False):
@@ -260,6 +293,7 @@ def animate_move(board, move, reverse=False):
         SCREEN.blit(IMAGES[img_key], (x, y))
         pygame.display.flip()
         pygame.time.delay(2)
+    renderer.invalidate()  #The animation has drawn over the board
 
 # -- Function to check special state --
 def check_special_states(board, game_over_message):
@@ -292,6 +326,7 @@ def display_message(message, color=(0, 0, 0)):
 
     #Display the text over the background and shadow
     SCREEN.blit(text, text_rect)
+    return background_rect
 
 # -- Function to choose a promote piece --
 def choose_promotion_piece(board, square):
@@ -354,6 +389,7 @@ def choose_promotion_piece(board, square):
                         running_promotion = False
                         break
 
+    renderer.invalidate()  #The menu has drawn over the board
     return promotion_choice
 
 # -- Function to draw sidebar buttons --
@@ -367,14 +403,12 @@ def draw_sidebar_buttons():
     button_texts = ["|<", "<", "AI", ">", ">|"]
     button_rects = []
 
-    font = pygame.font.Font(None, 32)
-
     for i in range(5):
         rect = pygame.Rect(start_x + i * (button_width + padding), start_y, button_width, 50)
         pygame.draw.rect(SCREEN, (0, 0, 0), rect)
         pygame.draw.rect(SCREEN, (50, 50, 50), rect, 2)  #Border
 
-        text_surf = font.render(button_texts[i], True, (255, 255, 255))
+        text_surf = render_text(button_texts[i], 32, (255, 255, 255))
         text_rect = text_surf.get_rect(center=rect.center)
         SCREEN.blit(text_surf, text_rect)
 
@@ -382,16 +416,200 @@ def draw_sidebar_buttons():
 
     return button_rects
 
+FPS = 60  #Maximum frame rate of the window
+THINKING_FPS = 30  #Frame rate of the window while the AI is thinking (leaves the processor to the search thread)
+
+#The AI searches in a background thread on a copy of the board, so the event loop keeps running (the window never freezes).
+#Clicking the AI button again plays the best move found so far, Escape cancels the search.
+class BackgroundSearch():
+    def __init__(self, board):
+        self.board = board.copy()
+        self.move = None
+        self.cancelled = False
+        self.stop_requested = False  #Set by force_move and cancel
+        self.info = None  #Search information of the last completed iteration (see search_info)
+        self.start_time = time.time()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        self.move = AI.AI_move(self.board, info_callback=self.on_info)
+
+    # -- Info callback of the search (called in the search thread after each iteration) --
+    def on_info(self, info):
+        print_search_info(info)
+        self.info = info
+        if self.stop_requested:
+            stop_search()  #The stop was requested before the start of the search, which reset the stop flag
+
+    def done(self):
+        return not self.thread.is_alive()
+
+    # -- Function to play the best move of the last completed iteration now --
+    def force_move(self):
+        self.stop_requested = True
+        stop_search()
+
+    # -- Function to stop the search without playing its move --
+    def cancel(self):
+        self.cancelled = True
+        self.stop_requested = True
+        stop_search()
+
+# -- Function to draw the thinking indicator at the bottom of the move list: live node count, and the depth, score, statistics
+#and principal variation of the last completed iteration --
+def draw_thinking_indicator(search, scroll_area_rect):
+    font = get_font(22)
+    line_height = 20
+    rect = pygame.Rect(scroll_area_rect.left, scroll_area_rect.bottom - 5 * line_height - 10, scroll_area_rect.width, 5 * line_height + 10)
+    pygame.draw.rect(SCREEN, (30, 30, 30), rect)
+    pygame.draw.rect(SCREEN, (120, 160, 180), rect, 2)
+
+    dots = '.' * (int((time.time() - search.start_time) * 2) % 4)
+    info = search.info
+    if info is None:
+        statistics = f"Depth -  Nodes {search_nodes}"
+        score = "Score -"
+        pv = "PV"
+    else:
+        statistics = f"Depth {info['depth']}/{info['seldepth']}  Nodes {max(search_nodes, info['nodes'])}  {info['nps']} n/s"
+        score = "  ".join([f"Score {info['score']:+.2f}", f"TT {format_rate(info['tt_hit_rate'])}", f"Cut1 {format_rate(info['first_move_cutoff_ratio'])}"]
+                          + format_eval_cache_rates(info, "Eval", "Pawn"))
+        pv = "PV " + ' '.join(info['pv'])
+    lines = [
+        f"AI thinking{dots}  {time.time() - search.start_time:.1f}s",
+        statistics,
+        score,
+        pv,
+        "AI: play now    Esc: cancel"
+    ]
+    for i, line in enumerate(lines):
+        #Shorten the line to the width of the indicator
+        while len(line) > 4 and font.size(line)[0] > rect.width - 10:
+            line = line[:-4] + '...'
+        SCREEN.blit(font.render(line, True, (225, 225, 225)), (rect.left + 5, rect.top + 5 + i * line_height))
+    return rect
+
+# -- Renderer that only draws again what changed since the previous frame (dirty rectangles) --
+#The state of each square (piece and highlights) and of each line of the move list is compared with what was drawn:
+#only the squares and lines that changed are drawn again, and only their rectangles are sent to the display.
+#An idle window therefore costs a few comparisons per frame instead of a full redraw and a flip.
+class DirtyRenderer():
+    def __init__(self):
+        self.check_square = None
+        self.checkmate = False
+        self.invalidate()
+
+    # -- Function that forces a full redraw at the next frame (resize, animation, promotion menu) --
+    def invalidate(self):
+        self.full_redraw = True
+
+    # -- Function to call after a change of position: the check and checkmate highlights are only computed here --
+    def set_position(self, board):
+        self.check_square = board.king(board.turn) if board.is_check() else None
+        self.checkmate = self.check_square is not None and board.is_checkmate()
+
+    # -- Function that draws a frame, returns the rectangles of the scrollbar, the scroll area and the buttons --
+    def render(self, board, selected_square, legal_moves, san_history, scroll_offset, ai_search, game_over_message):
+        dirty = []
+        if self.full_redraw or self.size != SCREEN.get_size():
+            self.full_redraw = False
+            self.size = SCREEN.get_size()
+            SCREEN.fill((200, 200, 200)) #Initial sidebar background
+            draw_sidebar_frame()
+            self.button_rects = draw_sidebar_buttons()
+            dirty.append(SCREEN.get_rect())
+            self.squares = {}  #State of each square as drawn
+            self.message = None
+            self.message_rect = None
+            self.lines = None  #Lines of the move list as drawn, by y position
+            self.scrollbar_rect = None
+
+        #Board: the squares under a message which disappears are drawn again
+        if game_over_message != self.message and self.message_rect:
+            for square in chess.SQUARES:
+                if square_rect(square).colliderect(self.message_rect):
+                    self.squares.pop(square, None)
+        targets = {move.to_square for move in legal_moves}
+        redrawn = []
+        for square in chess.SQUARES:
+            check = square == self.check_square
+            key = (board.piece_at(square), square == selected_square, square in targets, check, check and self.checkmate)
+            if self.squares.get(square) != key:
+                self.squares[square] = key
+                draw_square(square, *key)
+                redrawn.append(square_rect(square))
+        dirty += redrawn
+        if game_over_message and (game_over_message != self.message or any(rect.colliderect(self.message_rect) for rect in redrawn)):
+            self.message_rect = display_message(game_over_message)
+            dirty.append(self.message_rect)
+        elif not game_over_message:
+            self.message_rect = None
+        self.message = game_over_message
+
+        #Move list (lines and scrollbar are clipped to the scroll area): the whole scroll area is drawn again when it scrolls or when the thinking indicator disappears,
+        #otherwise only the lines that changed
+        scroll_area_rect = get_scroll_area_rect()
+        thinking = ai_search is not None
+        if self.lines is None or scroll_offset != self.scroll_offset or (self.thinking and not thinking):
+            pygame.draw.rect(SCREEN, SCROLL_AREA_BG, scroll_area_rect)
+            dirty.append(scroll_area_rect)
+            self.lines = {}
+            self.scrollbar_rect = None
+        self.scroll_offset = scroll_offset
+        self.thinking = thinking
+
+        lines_changed = False
+        visible_lines = {draw_y: (line, tuple(san_history[2 * line:2 * line + 2])) for line, draw_y in visible_move_lines(san_history, scroll_offset, scroll_area_rect)}
+        SCREEN.set_clip(scroll_area_rect)
+        for draw_y in list(self.lines):
+            if draw_y not in visible_lines:  #Line removed (moves replaced after going back in the history)
+                line_rect = pygame.Rect(scroll_area_rect.left, draw_y, scroll_area_rect.width, MOVE_LINE_HEIGHT)
+                pygame.draw.rect(SCREEN, SCROLL_AREA_BG, line_rect)
+                dirty.append(line_rect.clip(scroll_area_rect))
+                del self.lines[draw_y]
+                lines_changed = True
+        for draw_y, key in visible_lines.items():
+            if self.lines.get(draw_y) != key:
+                self.lines[draw_y] = key
+                line_rect = pygame.Rect(scroll_area_rect.left, draw_y, scroll_area_rect.width, MOVE_LINE_HEIGHT)
+                pygame.draw.rect(SCREEN, SCROLL_AREA_BG, line_rect)
+                draw_move_line(san_history, key[0], draw_y)
+                dirty.append(line_rect.clip(scroll_area_rect))
+                lines_changed = True
+
+        scrollbar_rect = get_scrollbar_rect(san_history, scroll_offset, scroll_area_rect)
+        if lines_changed or scrollbar_rect != self.scrollbar_rect:
+            if self.scrollbar_rect:
+                pygame.draw.rect(SCREEN, SCROLL_AREA_BG, self.scrollbar_rect)
+                dirty.append(self.scrollbar_rect.clip(scroll_area_rect))
+            if scrollbar_rect:
+                pygame.draw.rect(SCREEN, (100, 100, 100), scrollbar_rect)
+                dirty.append(scrollbar_rect.clip(scroll_area_rect))
+        self.scrollbar_rect = scrollbar_rect
+        SCREEN.set_clip(None)
+
+        if thinking:
+            dirty.append(draw_thinking_indicator(ai_search, scroll_area_rect))
+
+        if dirty:
+            pygame.display.update(dirty)
+        return scrollbar_rect, scroll_area_rect, self.button_rects
+
+renderer = DirtyRenderer()
+
 # -- Main function --
 def main():
+    init_display()
     board = chess.Board()
     load_images()
     selected_square = None
-    move_made = False
+    checked_position = None  #Position of the last game state checks
     game_over_message = None
     running = True
     game_over = False
     move_history = []
+    san_history = []  #SAN of the moves of move_history, computed once when the move is played
     current_move_index = -1
     left_arrow_pressed = False
     right_arrow_pressed = False
@@ -401,43 +619,33 @@ def main():
     scroll_speed = 20
     scrollbar_dragging = False
     scrollbar_rect = None
+    ai_search = None  #Search of the AI running in the background (None when the AI is not thinking)
+    clock = pygame.time.Clock()
 
     while running:
         legal_moves = []
         if selected_square is not None:
             legal_moves = [move for move in board.legal_moves if move.from_square == selected_square]
-        SCREEN.fill((200, 200, 200)) #Initial sidebar background
-        draw_board(selected_square, legal_moves, board)
-        draw_pieces(board)
-        #Create a temporary board to properly calculate SAN
-        temp_board = chess.Board()
-        san_history = []
-        for move in move_history:
-            try:
-                if move in temp_board.legal_moves:
-                    san_history.append(temp_board.san(move))
-                    temp_board.push(move)
-            except:
-                pass
-        scrollbar_rect, scroll_area_rect = draw_sidebar(san_history, scroll_offset)
-        button_rects = draw_sidebar_buttons()
-
 
+        #Game state checks (end of game, check) only after a change of position, not at every frame
+        position = (board.fen(), len(board.move_stack))
+        if position != checked_position:
+            checked_position = position
+            game_over_message = check_special_states(board, None)
+            game_over = game_over_message is not None
+            renderer.set_position(board)
 
-        if game_over_message:
-            display_message(game_over_message)
-
-        pygame.display.flip()
-
-        if not game_over and (board.is_checkmate() or board.is_stalemate() or board.is_insufficient_material() or board.can_claim_threefold_repetition() or board.can_claim_fifty_moves()):
-            game_over_message = check_special_states(board, game_over_message)
-            game_over = True
+        scrollbar_rect, scroll_area_rect, button_rects = renderer.render(board, selected_square, legal_moves, san_history, scroll_offset, ai_search, game_over_message)
 
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
                 running = False
+                if ai_search is not None:
+                    ai_search.cancel()
             if event.type == pygame.VIDEORESIZE:
                 toggle_fullscreen()
+            elif event.type == pygame.WINDOWEXPOSED:
+                renderer.invalidate()
 
             elif event.type == pygame.MOUSEBUTTONDOWN:
                 mouse_pos = pygame.mouse.get_pos()
@@ -449,14 +657,14 @@ def main():
                 #Check if one of the buttons was clicked
                 for i, rect in enumerate(button_rects):
                     if rect.collidepoint(mouse_pos):
-                        if i == 0:  #Go to the beginning
+                        if ai_search is not None and i != 2:
+                            pass  #The position cannot change while the AI is thinking
+                        elif i == 0:  #Go to the beginning
                             while current_move_index >= 0:
                                 move = move_history[current_move_index]
                                 board.pop()
                                 animate_move(board, move, reverse=True)
                                 current_move_index -= 1
-                            game_over_message = None
-                            game_over = False
 
                         elif i == 1:  #Step backward (equivalent to left arrow key)
                             if current_move_index >= 0:
@@ -464,19 +672,11 @@ def main():
                                 board.pop()
                                 animate_move(board, move, reverse=True)
                                 current_move_index -= 1
-                                game_over_message = None
-                                game_over = False
-                        elif i == 2:  #Random button
-                            if not game_over:
-                                move = AI.AI_move(board)
-                                if move:
-                                    board.push(move)
-                                    move_history.append(move)
-                                    current_move_index += 1
-                                    move_made = True
-                                move_history.append(board.peek())
-                                current_move_index += 1
-                                move_made = True
+                        elif i == 2:  #AI button: starts the search in the background, or plays the best move found so far if the AI is thinking
+                            if ai_search is not None:
+                                ai_search.force_move()
+                            elif not game_over:
+                                ai_search = BackgroundSearch(board)
 
                         elif i == 3:  #Step forward (equivalent to right arrow key)
                             if current_move_index < len(move_history) - 1:
@@ -504,6 +704,9 @@ def main():
                     max_offset = max(0, content_height - scroll_area_rect.height)
                     scroll_offset = min(max_offset, scroll_offset + scroll_speed)
 
+                if ai_search is not None:
+                    continue  #No move on the board while the AI is thinking
+
                 location = pygame.mouse.get_pos()
                 if location[0] < BOARD_WIDTH and location[1] < HEIGHT:
                     col = location[0] // (BOARD_WIDTH // 8)
@@ -521,11 +724,12 @@ def main():
                         move = chess.Move(selected_square, square)
                         if move in board.legal_moves:
                             animate_move(board, move)  #Apply the animation
+                            san_history = san_history[:current_move_index + 1]
+                            san_history.append(board.san(move))
                             board.push(move)
                             move_history = move_history[:current_move_index + 1]
                             move_history.append(move)
                             current_move_index += 1
-                            move_made = True
                             selected_square = None
                         elif board.piece_at(selected_square) is not None and board.piece_at(selected_square).piece_type == chess.PAWN: #to include pawns reaching the last rank but not pinned pieces on the last rank
                             promotion_moves = [move for move in board.legal_moves if move.from_square == selected_square and move.to_square == square and move.promotion]
@@ -535,11 +739,12 @@ def main():
                                 promotion_move = chess.Move.from_uci(chess.square_name(selected_square) + chess.square_name(square) + promotion_piece)
                                 if promotion_move in board.legal_moves:
                                     animate_move(board, promotion_move) #Apply the animation
+                                    san_history = san_history[:current_move_index + 1]
+                                    san_history.append(board.san(promotion_move))
                                     board.push(promotion_move)
                                     move_history = move_history[:current_move_index + 1]
                                     move_history.append(promotion_move)
                                     current_move_index += 1
-                                    move_made = True
                             selected_square = None
                     else:
                         selected_square = None
@@ -563,7 +768,14 @@ def main():
 
                 
             elif event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_u:
+                if event.key == pygame.K_ESCAPE:
+                    if ai_search is not None:
+                        ai_search.cancel()
+
+                elif ai_search is not None:
+                    pass  #The position cannot change while the AI is thinking
+
+                elif event.key == pygame.K_u:
                     if board.move_stack:
                         board.pop()
                         current_move_index -= 1
@@ -583,8 +795,10 @@ def main():
                 elif event.key == pygame.K_RIGHT:
                     right_arrow_pressed = False
 
-        #Handle long press on left and right arrow keys
+        #Handle long press on left and right arrow keys (not while the AI is thinking: its move is for the current position)
         current_time = pygame.time.get_ticks()
+        if ai_search is not None:
+            left_arrow_pressed = right_arrow_pressed = False
         if left_arrow_pressed and current_time - arrow_press_start_time >= arrow_press_interval:
             if current_move_index >= 0:
                 move = move_history[current_move_index]
@@ -592,9 +806,6 @@ def main():
                 animate_move(board, move, reverse=True)  #Apply reverse animation to go backward
                 current_move_index -= 1
                 arrow_press_start_time = current_time
-                if game_over_message and not (board.is_checkmate() or board.is_stalemate() or board.is_insufficient_material() or board.can_claim_threefold_repetition() or board.can_claim_fifty_moves()):
-                    game_over_message = None
-                    game_over = False
 
         if right_arrow_pressed and current_time - arrow_press_start_time >= arrow_press_interval:
             if current_move_index < len(move_history) - 1:
@@ -604,85 +815,62 @@ def main():
                 board.push(move)
                 arrow_press_start_time = current_time
 
-        if move_made:
-            if not game_over:
-                game_over_message = check_special_states(board, game_over_message)
-            move_made = False
-    pygame.quit()
-
-#List of specific PGN file names to process : 29041 games
-PGN_FILE_NAMES = [
-    "VachierLagrave.pgn",
-    "Ding.pgn",
-    "Karpov.pgn",
-    "Kasparov.pgn",
-    "Carlsen.pgn",
-    "Caruana.pgn",
-    "Firouzja.pgn"
-]
-
-#Path to the PGN folder within the current working directory
-PGN_FOLDER_PATH = os.path.join(os.getcwd(), 'PGN')
-
-# -- Function to build the opening book --
-def build_opening_book(PGN_FILE_NAMES, max_depth=10):
-    opening_book = defaultdict(lambda: defaultdict(int))
-    total_games = 0
-
-    for pgn_file_name in PGN_FILE_NAMES:
-        pgn_path = os.path.join(PGN_FOLDER_PATH, pgn_file_name)
-        with open(pgn_path, 'r', encoding='latin-1', errors='ignore') as pgn_file:
-            while True:
-                game = chess.pgn.read_game(pgn_file)
-                if game is None:
-                    break
-
-                total_games += 1
-                board = game.board()
-
-                for move in game.mainline_moves():
-                    if board.fullmove_number > max_depth:
-                        break
-                    san_move = board.san(move)
-                    fen = board.board_fen()
-                    opening_book[fen][san_move] += 1
-                    board.push(move)
-
-    print(f"Total games in opening book: {total_games}")
-    return opening_book
-
-#Build the opening book
-opening_book = build_opening_book(PGN_FILE_NAMES)
+        #Play the move of the AI when its search is over
+        if ai_search is not None and ai_search.done():
+            move = ai_search.move
+            if move and not ai_search.cancelled and move in board.legal_moves:
+                san_history = san_history[:current_move_index + 1]
+                san_history.append(board.san(move))
+                board.push(move)
+                move_history = move_history[:current_move_index + 1]
+                move_history.append(move)
+                current_move_index += 1
+            ai_search = None
 
-#Save the opening book
-with open('learned_opening_book.json', 'w') as json_file:
-    json.dump(opening_book, json_file, indent=4)
+        clock.tick(THINKING_FPS if ai_search is not None else FPS)
+    pygame.quit()
 
-print("Opening book saved to learned_opening_book.json")
+#Load the opening book built by opening_book.py (Polyglot file, memory-mapped: nothing is parsed at startup)
+opening_book = load_opening_book(OPENING_BOOK_FILE)
 
 # -- Function to get an opening move --
 def get_opening_move(board):
-    fen = board.board_fen()
-    if fen in opening_book:
+    if opening_book is None:
+        return None
+    #Most played move of the position (the book only contains legal moves for the position)
+    entry = opening_book.get(board)
+    if entry is not None:
         print("Opening move detected. Using book move.")
-        possible_moves = opening_book[fen]
-        best_move = max(possible_moves, key=possible_moves.get)
-        
-        try:
-            #Directly play using SAN
-            move = board.parse_san(best_move)  #Use SAN directly
-            if move in board.legal_moves:
-                return move
-            else:
-                print(f"Move {best_move} from book is illegal in this position.")
-        except Exception as e:
-            print(f"Error parsing SAN move from book: {e}")
+        return entry.move
     
     return None
 
 CHECKMATE = 1000
 DRAW = 0
-DEPTH = 4 #Number of half-moves
+DEPTH = 4 #Number of half-moves searched when there is no time limit
+TIME_LIMIT = 5.0 #Time budget in seconds for each AI move (None: fixed search at DEPTH)
+MAX_DEPTH = 32 #Maximum depth reached by iterative deepening within the time budget
+MOVES_TO_GO = 30 #Number of moves the remaining clock time is shared between when no move count is given
+TT_SIZE_MB = 64 #Memory budget of the transposition table (of each process of the search)
+SEARCH_PROCESSES = 1 #Number of processes of the search (1: single process, more: the root moves are split across a pool of processes)
+EVALUATOR = 'incremental' #Evaluation used by the search: 'standard' (evaluate_board with a cache), 'bitboard' or 'incremental' (updated on push/pop)
+VERIFY_EVALUATOR = False #Check every evaluation of the selected evaluator against evaluate_board (slow, for debugging)
+QUIESCENCE = True #Search the captures at the horizon of the search instead of stopping on a static evaluation
+QUIESCENCE_CHECK_EVASIONS = False #In the quiescence search, also search every evasion when the side to move is in check
+DELTA_MARGIN = 2.0 #Delta pruning: captures that cannot raise alpha even with this margin (in pawns) are skipped
+MAX_PLY = 64 #Maximum distance from the root for the killer moves
+PVS = True #Principal variation search: the moves after the first one are searched with a null window, and searched again only if they are better
+NULL_WINDOW = 1e-6 #Width of the null window (in pawns)
+ASPIRATION_WINDOW = 0.5 #Half-width of the root window around the score of the previous iteration, in pawns (None: always a full window)
+ASPIRATION_MIN_DEPTH = 3 #Iterations below this depth use a full window
+NULL_MOVE_PRUNING = True #Skip the search of a node when passing the turn already gives a score above beta
+NULL_MOVE_MIN_DEPTH = 3 #Minimum remaining depth for null-move pruning
+NULL_MOVE_REDUCTION = 2 #Depth reduction of the search after the null move
+LATE_MOVE_REDUCTIONS = True #Search the quiet moves ordered late at a reduced depth, and at full depth only if they turn out better than alpha
+LMR_MIN_DEPTH = 3 #Minimum remaining depth for late-move reductions
+LMR_MIN_MOVES = 3 #Number of moves of a node searched at full depth before reducing
+LMR_BASE = 0.75 #Reduction of the late moves: LMR_BASE + log(depth) * log(move number) / LMR_DIVISOR plies
+LMR_DIVISOR = 2.25
 
 params = {
     'pawn_value': 0.6913448662622311,  #Pawn value
@@ -704,8 +892,11 @@ params = {
     'king_proximity_to_center_endgame': 0.3275250912748785  #Bonus for a king near the center in the endgame
 }
 
+#The search time of an AI move can be given directly (time_limit, in seconds) or derived from a game clock with allocate_time.
+#Without arguments, TIME_LIMIT is used (or a fixed search at DEPTH if TIME_LIMIT is None).
+#info_callback is called with the search information (see search_info) after each completed iteration (None: no report).
 class AI():
-    def AI_move(board):
+    def AI_move(board, time_limit=None, max_depth=None, info_callback=None):
         global nextMove
         nextMove = None
         #Check for mate in one
@@ -720,7 +911,17 @@ class AI():
         
         if nextMove is None:
             print("Not an opening position. Using NegaMax.")
-            nextMove = findMoveNegaMaxAlphaBeta(board, DEPTH, -1000, 1000, 1 if board.turn == chess.WHITE else -1)
+            if time_limit is None and max_depth is None:
+                time_limit = TIME_LIMIT
+                max_depth = DEPTH if TIME_LIMIT is None else MAX_DEPTH
+            elif max_depth is None:
+                max_depth = MAX_DEPTH
+            if info_callback is None:
+                info_callback = print_search_info
+            if SEARCH_PROCESSES > 1:
+                nextMove = findMoveParallel(board, max_depth, time_limit, info_callback)
+            else:
+                nextMove = findMoveIterativeDeepening(board, max_depth, time_limit, info_callback)
         
         #Convert the move to SAN notation for display
         if nextMove and nextMove in board.legal_moves:
@@ -735,22 +936,483 @@ class AI():
 #Beta: the best value that the minimizing player (Black) can guarantee.
 #Thanks to move ordering, the best moves (strong captures) are tested first. This maximizes the chances of triggering Alpha-Beta pruning, as good moves quickly increase alpha or reduce beta.
 
-# -- Optimized NegaMax function with Move Ordering (MVV-LVA) --
-def findMoveNegaMaxAlphaBeta(board, depth, alpha, beta, turnColor):
-    global nextMove
-    if depth == 0:
-        return turnColor * evaluate_board_cached(board.fen())
+# -- Function to derive the time budget of a move from a game clock (time left and increment in seconds) --
+def allocate_time(time_left, increment=0, moves_to_go=None):
+    if moves_to_go is None or moves_to_go <= 0:
+        moves_to_go = MOVES_TO_GO
+    budget = time_left / moves_to_go + increment * 0.8
+    #Never use more than half of the remaining time, and keep a safety margin for the move transmission
+    return max(0.05, min(budget, time_left * 0.5) - 0.05)
+
+#Exception raised inside the search when the time budget is exhausted
+class SearchTimeout(Exception):
+    pass
+
+search_deadline = None  #Time at which the current search must stop (None: no limit)
+
+#The search can be stopped from another thread (e.g. the GUI) with stop_search: it then returns the best move of the last completed iteration.
+#The flag is in shared memory, so the processes of the parallel search see it too.
+stop_flag = RawValue('b', 0)
+search_nodes = 0  #Number of nodes (NegaMax and quiescence) visited by the current search
+
+#Counters of the current search, to tell whether a slow move comes from the move ordering, the cost of the evaluation or the size of the tree:
+#- seldepth: maximum distance from the root reached (quiescence included),
+#- tt_probes, tt_hits: lookups of the transposition table and positions found,
+#- cutoffs, first_move_cutoffs: beta cutoffs, and those caused by the first move searched (good ordering: above 90%),
+#- eval_cache_lookups, eval_cache_hits: lookups of the Zobrist-keyed evaluation cache (evaluator 'standard') and positions found,
+#- pawn_table_lookups, pawn_table_hits: lookups of the pawn structure table (evaluator 'incremental') and pawn structures found.
+search_stats = {'seldepth': 0, 'tt_probes': 0, 'tt_hits': 0, 'cutoffs': 0, 'first_move_cutoffs': 0, 'eval_cache_lookups': 0, 'eval_cache_hits': 0,
+                'pawn_table_lookups': 0, 'pawn_table_hits': 0}
+eval_cache_start = (0, 0, 0, 0)  #Counts of the evaluator caches at the start of the search
+
+#Result of the last completed iteration, given to the info callback: depth, seldepth, score (from White's point of view), principal variation
+#(pv in SAN, pv_uci in UCI), time, nodes, nodes per second and the hit rates of the counters (None when there was no lookup, e.g. the
+#evaluation cache when the evaluator is not 'standard')
+search_info = {'depth': 0, 'seldepth': 0, 'score': None, 'pv': [], 'pv_uci': [], 'time': 0.0, 'nodes': 0, 'nps': 0,
+               'tt_hit_rate': None, 'first_move_cutoff_ratio': None, 'eval_cache_hit_rate': None, 'pawn_table_hit_rate': None}
+
+# -- Function to stop the current search as soon as possible --
+def stop_search():
+    stop_flag.value = 1
+
+# -- Function that returns the number of hits and lookups (since the start of the program) of the evaluation cache and of the pawn table --
+def eval_cache_counts():
+    return eval_cache_hits, eval_cache_lookups, incremental_evaluator.pawn_table_hits, incremental_evaluator.pawn_table_lookups
+
+# -- Function that resets the node counter and the counters of the search --
+def reset_search_stats():
+    global search_nodes, eval_cache_start
+    search_nodes = 0
+    for name in search_stats:
+        search_stats[name] = 0
+    check_eval_cache_params()
+    eval_cache_start = eval_cache_counts()
+
+# -- Function that updates the counters of the evaluator caches since the start of the search --
+def update_eval_cache_stats():
+    names = ['eval_cache_hits', 'eval_cache_lookups', 'pawn_table_hits', 'pawn_table_lookups']
+    for name, count, start in zip(names, eval_cache_counts(), eval_cache_start):
+        search_stats[name] = count - start
+
+# -- Function that resets the stop flag, the counters and the search information at the start of a search --
+def start_search_info():
+    stop_flag.value = 0
+    reset_search_stats()
+    search_info.update(depth=0, seldepth=0, score=None, pv=[], pv_uci=[], time=0.0, nodes=0, nps=0,
+                       tt_hit_rate=None, first_move_cutoff_ratio=None, eval_cache_hit_rate=None, pawn_table_hit_rate=None)
+
+def ratio(count, total):
+    return count / total if total else None
+
+# -- Function that fills search_info at the end of an iteration and sends a copy to the info callback --
+def report_iteration(board, depth, score, pv_moves, elapsed, info_callback):
+    pv = []
+    pv_board = board.copy(stack=False)
+    for move in pv_moves:
+        pv.append(pv_board.san(move))
+        pv_board.push(move)
+    search_info.update(depth=depth, seldepth=max(depth, search_stats['seldepth']), score=score, pv=pv, pv_uci=[move.uci() for move in pv_moves],
+                       time=elapsed, nodes=search_nodes, nps=int(search_nodes / elapsed) if elapsed > 0 else 0,
+                       tt_hit_rate=ratio(search_stats['tt_hits'], search_stats['tt_probes']),
+                       first_move_cutoff_ratio=ratio(search_stats['first_move_cutoffs'], search_stats['cutoffs']),
+                       eval_cache_hit_rate=ratio(search_stats['eval_cache_hits'], search_stats['eval_cache_lookups']),
+                       pawn_table_hit_rate=ratio(search_stats['pawn_table_hits'], search_stats['pawn_table_lookups']))
+    if info_callback is not None:
+        info_callback(dict(search_info))
+
+# -- Function that formats a rate as a percentage ('-' when there was no lookup) --
+def format_rate(rate):
+    return '-' if rate is None else f"{100 * rate:.0f}%"
+
+# -- Function that describes the hit rates of the evaluator caches used by the search (empty when none was used) --
+def format_eval_cache_rates(info, eval_cache_label, pawn_table_label):
+    rates = []
+    if info['eval_cache_hit_rate'] is not None:
+        rates.append(f"{eval_cache_label} {format_rate(info['eval_cache_hit_rate'])}")
+    if info['pawn_table_hit_rate'] is not None:
+        rates.append(f"{pawn_table_label} {format_rate(info['pawn_table_hit_rate'])}")
+    return rates
+
+# -- Info callback of the command line: prints one line per iteration --
+def print_search_info(info):
+    statistics = [f"{info['nodes']} nodes", f"{info['nps']} nodes/s", f"TT hits {format_rate(info['tt_hit_rate'])}",
+                  f"first move cutoffs {format_rate(info['first_move_cutoff_ratio'])}"]
+    statistics += format_eval_cache_rates(info, "eval cache hits", "pawn table hits")
+    print(f"Depth {info['depth']}/{info['seldepth']}: score {info['score']:.2f}, PV {' '.join(info['pv'])} ({info['time']:.2f}s, {', '.join(statistics)})")
+
+# -- Iterative deepening: search at depth 1, 2, 3... until the time budget is exhausted --
+#Each iteration stores its best moves in the transposition table, so the principal variation of the previous iteration is searched first.
+#The move returned is the best move of the last completed iteration.
+def findMoveIterativeDeepening(board, max_depth, time_limit=None, info_callback=None):
+    global search_deadline
+    turnColor = 1 if board.turn == chess.WHITE else -1
+    start_time = time.time()
+    deadline = start_time + time_limit if time_limit is not None else math.inf  #Without time limit, only stop_search ends the search early
+    stack_size = len(board.move_stack)
+    best_move = None
+    start_search_info()
+    transposition_table.new_search()
+    clear_move_ordering_tables()
 
-    maxScore = -1000
+    for depth in range(1, max_depth + 1):
+        search_deadline = deadline if depth > 1 else None  #The first iteration always completes so that a move is available
+        use_aspiration = ASPIRATION_WINDOW is not None and depth >= ASPIRATION_MIN_DEPTH and best_move is not None
+        try:
+            move = search_root(board, depth, turnColor, nextScore if use_aspiration else None)
+        except SearchTimeout:
+            #Undo the moves of the unfinished iteration
+            while len(board.move_stack) > stack_size:
+                board.pop()
+            break
+        if move is None:
+            break
+        best_move = move
+
+        elapsed = time.time() - start_time
+        update_eval_cache_stats()
+        report_iteration(board, depth, nextScore * turnColor, get_principal_variation(board, depth), elapsed, info_callback)
+
+        if abs(nextScore) >= CHECKMATE:
+            break  #A forced mate has been found
+        #The next iteration takes several times longer than this one: do not start it if it cannot finish in time
+        if time_limit is not None and elapsed > time_limit / 2:
+            break
+
+    search_deadline = None
+    return best_move
+
+#Aspiration window: the score of an iteration is usually close to the score of the previous one, so the root is searched with a narrow window around it,
+#which prunes more. If the score falls outside the window (fail low or fail high), the search is repeated with a window widened on that side.
+
+# -- Function that searches the root at a given depth, with an aspiration window around previous_score (None: full window) --
+def search_root(board, depth, turnColor, previous_score=None):
+    alpha, beta = -1000, 1000
+    if previous_score is not None:
+        window = ASPIRATION_WINDOW
+        alpha, beta = max(-1000, previous_score - window), min(1000, previous_score + window)
+    while True:
+        incremental_evaluator.reset(board)
+        move = findMoveNegaMaxAlphaBeta(board, depth, alpha, beta, turnColor)
+        if nextScore <= alpha and alpha > -1000:
+            window *= 4
+            alpha = max(-1000, previous_score - window)
+        elif nextScore >= beta and beta < 1000:
+            window *= 4
+            beta = min(1000, previous_score + window)
+        else:
+            return move
+
+#Parallel search (SEARCH_PROCESSES > 1): Python threads cannot run the search on several cores at the same time, so the root moves are split across processes.
+#At each iteration, the first root move (best move of the previous iteration) is searched with the full window, then the other root moves
+#are searched in parallel with a null window against its score, and searched again with an open window by their worker if they are better.
+#A root move goes to whichever worker is free, so each task starts with an empty transposition table and empty killer moves and history:
+#the score of a root move only depends on the move, the depth and the window, not on the worker or on the moves it searched before.
+#The results are merged in the order of the root moves (the first best score wins). Without time limit, the move and the score are then
+#the same from one run to the next, whatever the order in which the workers finish (they can differ from those of the serial search,
+#which shares its tables between the root moves).
+search_pool = None  #Pool of processes of the parallel search, created at the first parallel search and kept for the next moves
+
+# -- Function that returns the pool of processes of the parallel search --
+def get_search_pool():
+    global search_pool
+    if search_pool is None:
+        search_pool = Pool(SEARCH_PROCESSES, initializer=init_search_worker, initargs=(stop_flag,))
+    return search_pool
+
+# -- Function that stops the processes of the search pool (a new pool is created at the next parallel search) --
+#Needed when the number of processes, the size of the transposition table or the parameters change: the workers keep their own copies.
+def close_search_pool():
+    global search_pool
+    if search_pool is not None:
+        search_pool.terminate()
+        search_pool = None
+
+def init_search_worker(flag):
+    global stop_flag
+    stop_flag = flag
+
+# -- Worker function: searches one root move, returns its score for the side to move at the root (None if the time is over),
+#the number of nodes and the counters of the search of the move --
+#alpha is None for a full window search, otherwise the move is only searched with an open window if it is better than alpha.
+def search_root_move_worker(task):
+    reset_search_stats()
+    score = search_root_move(task)
+    update_eval_cache_stats()
+    return score, search_nodes, dict(search_stats)
+
+def search_root_move(task):
+    global search_deadline
+    board, move, depth, alpha, deadline = task
+    transposition_table.clear()
+    clear_move_ordering_tables()
+    search_deadline = deadline
+    turnColor = 1 if board.turn == chess.WHITE else -1
+    incremental_evaluator.reset(board)
+    push_move(board, move)
+    try:
+        if alpha is None:
+            return -findMoveNegaMaxAlphaBeta(board, depth - 1, -1000, 1000, -turnColor, 1)
+        score = -findMoveNegaMaxAlphaBeta(board, depth - 1, -alpha - NULL_WINDOW, -alpha, -turnColor, 1)
+        if score > alpha:
+            score = -findMoveNegaMaxAlphaBeta(board, depth - 1, -1000, -alpha, -turnColor, 1)
+        return score
+    except SearchTimeout:
+        return None
+
+# -- Iterative deepening with the root moves split across the processes of the search pool --
+def findMoveParallel(board, max_depth, time_limit=None, info_callback=None):
+    global search_nodes
+    turnColor = 1 if board.turn == chess.WHITE else -1
+    start_time = time.time()
+    deadline = start_time + time_limit if time_limit is not None else math.inf  #Without time limit, only stop_search ends the search early
+    pool = get_search_pool()
+    start_search_info()
+    clear_move_ordering_tables()
+    root_moves = list(generate_ordered_moves(board, None, 0))
+    if not root_moves:
+        return None
     best_move = None
 
-    #Correction: pass the parameters into move_ordering
-    moves = sorted(board.legal_moves, key=lambda move: move_ordering(board, move, params), reverse=True)
+    for depth in range(1, max_depth + 1):
+        iteration_deadline = deadline if depth > 1 else None  #The first iteration always completes so that a move is available
+        results = [pool.apply(search_root_move_worker, ((board, root_moves[0], depth, None, iteration_deadline),))]
+        first_score = results[0][0]
+        if first_score is not None:
+            tasks = [(board, move, depth, first_score, iteration_deadline) for move in root_moves[1:]]
+            results += pool.map(search_root_move_worker, tasks, chunksize=1)
+        #The nodes and counters of the workers are added to those of the search
+        for _, nodes, stats in results:
+            search_nodes += nodes
+            search_stats['seldepth'] = max(search_stats['seldepth'], stats['seldepth'])
+            for name in search_stats:
+                if name != 'seldepth':
+                    search_stats[name] += stats[name]
+        scores = [score for score, _, _ in results]
+        if None in scores or len(scores) < len(root_moves):
+            break  #The iteration did not complete: the best move of the previous one is played
+
+        #The best move is the first one with the best score, and the root moves are searched by decreasing score at the next iteration
+        order = sorted(range(len(root_moves)), key=lambda i: -scores[i])
+        root_moves = [root_moves[i] for i in order]
+        best_move, best_score = root_moves[0], scores[order[0]]
+
+        elapsed = time.time() - start_time
+        report_iteration(board, depth, best_score * turnColor, [best_move], elapsed, info_callback)
+
+        if abs(best_score) >= CHECKMATE:
+            break  #A forced mate has been found
+        #The next iteration takes several times longer than this one: do not start it if it cannot finish in time
+        if time_limit is not None and elapsed > time_limit / 2:
+            break
 
-    for move in moves:
-        board.push(move)
-        score = -findMoveNegaMaxAlphaBeta(board, depth - 1, -beta, -alpha, -turnColor)
-        board.pop()
+    return best_move
+
+# -- Function that returns the principal variation (list of moves) stored in the transposition table --
+def get_principal_variation(board, depth):
+    pv_board = board.copy()
+    pv = []
+    for _ in range(depth):
+        move = transposition_table.get_move(zobrist_key(pv_board))
+        if move is None or move not in pv_board.legal_moves:
+            break
+        pv.append(move)
+        pv_board.push(move)
+    return pv
+
+#The incremental evaluator follows the moves played in the search to evaluate the leaves without rescanning the board.
+incremental_evaluator = IncrementalEvaluator()
+
+# -- Functions to play and undo a move in the search (the incremental evaluator follows the board) --
+def push_move(board, move):
+    if EVALUATOR == 'incremental':
+        incremental_evaluator.push(board, move)
+    board.push(move)
+
+def pop_move(board):
+    board.pop()
+    if EVALUATOR == 'incremental':
+        incremental_evaluator.pop()
+
+# -- Function that evaluates a leaf of the search with the selected evaluator (score from White's point of view) --
+def evaluate_leaf(board):
+    if EVALUATOR == 'incremental':
+        score = incremental_evaluator.evaluate(board, params)
+    elif EVALUATOR == 'bitboard':
+        score = evaluate_board_bitboard(board, params)
+    else:
+        return evaluate_board_cached(board)
+    if VERIFY_EVALUATOR:
+        expected = evaluate_board(board, params)
+        assert math.isclose(score, expected, abs_tol=1e-9), f"{EVALUATOR} evaluation {score} differs from evaluate_board {expected} for {board.fen()}"
+    return score
+
+#Quiet moves which caused a beta cutoff are likely to cause one again in the positions searched next:
+#- killer moves: the last two quiet moves which caused a cutoff at the same distance from the root (sibling positions),
+#- history table: for each (from square, to square), the sum of depth * depth of the cutoffs it caused anywhere in the search.
+killer_moves = [[None, None] for _ in range(MAX_PLY)]
+history_table = [0] * 4096
+
+# -- Function that forgets the killer moves and the history of the previous search --
+def clear_move_ordering_tables():
+    for killers in killer_moves:
+        killers[0] = killers[1] = None
+    for i in range(len(history_table)):
+        history_table[i] = 0
+
+# -- Function that records a quiet move which caused a beta cutoff --
+def update_move_ordering_tables(move, depth, ply):
+    killers = killer_moves[ply]
+    if killers[0] != move:
+        killers[1] = killers[0]
+        killers[0] = move
+    history_table[move.from_square * 64 + move.to_square] += depth * depth
+
+# -- MVV-LVA (Most Valuable Victim - Least Valuable Attacker): score of each (victim, attacker) pair of piece types, in hundredths of a pawn --
+def build_mvv_lva_table(params):
+    values = [0] * 7
+    for piece_type, name in PIECE_VALUE_NAMES.items():
+        values[piece_type] = params[name]
+    return [[round(100 * (values[victim] - values[attacker])) for attacker in range(7)] for victim in range(7)]
+
+mvv_lva_table = build_mvv_lva_table(params)
+
+# -- Function that replaces the parameters of the evaluation (the names not used by the evaluation are ignored) --
+#params is updated in place, and everything computed with the previous parameters is forgotten: MVV-LVA table, evaluation cache,
+#transposition table and the workers of the parallel search.
+def set_params(new_params):
+    global mvv_lva_table
+    params.update({name: value for name, value in new_params.items() if name in params})
+    mvv_lva_table = build_mvv_lva_table(params)
+    clear_eval_cache()
+    transposition_table.clear()
+    close_search_pool()
+
+# -- Function that loads the parameters of the evaluation from a JSON file (e.g. trained_parameters.json) --
+def load_params(path):
+    with open(path, 'r') as json_file:
+        set_params(json.load(json_file))
+
+# -- Function that returns the MVV-LVA score of a capture (0 for a promotion without capture) --
+def capture_score(board, move):
+    victim = chess.PAWN if board.is_en_passant(move) else board.piece_type_at(move.to_square)
+    if victim is None:
+        return 0
+    return mvv_lva_table[victim][board.piece_type_at(move.from_square)]
+
+# -- Staged move picker: yields the moves of a node of the search in order, generating each stage only when it is reached --
+#1. transposition table move, 2. winning and equal captures (MVV-LVA) and promotions, 3. killer moves, 4. quiet moves by history, 5. losing captures.
+#When the first moves cause a beta cutoff, the quiet moves are never generated nor sorted.
+def generate_ordered_moves(board, tt_move, ply):
+    if tt_move is not None and board.is_pseudo_legal(tt_move) and board.is_legal(tt_move):
+        yield tt_move
+    else:
+        tt_move = None
+
+    captures = [(capture_score(board, move), move) for move in board.generate_legal_captures() if move != tt_move]
+    own_pawns = board.pawns & board.occupied_co[board.turn]
+    captures += [(0, move) for move in board.generate_legal_moves(own_pawns, chess.BB_BACKRANKS & ~board.occupied) if move != tt_move]
+    captures.sort(key=lambda capture: capture[0], reverse=True)
+    losing_captures = []
+    for score, move in captures:
+        if score < 0:
+            losing_captures.append(move)
+        else:
+            yield move
+
+    killers = [killer for killer in killer_moves[ply]
+               if killer is not None and killer != tt_move and not killer.promotion and board.is_pseudo_legal(killer) and not board.is_capture(killer) and board.is_legal(killer)]
+    yield from killers
+
+    quiets = [move for move in board.generate_legal_moves(chess.BB_ALL, ~board.occupied_co[not board.turn])
+              if not move.promotion and move != tt_move and move not in killers and not board.is_en_passant(move)]
+    quiets.sort(key=lambda move: history_table[move.from_square * 64 + move.to_square], reverse=True)
+    yield from quiets
+
+    yield from losing_captures
+
+#The transposition table stores the result of every searched position, so a position reached again through another move order is not searched twice.
+transposition_table = TranspositionTable(TT_SIZE_MB)
+
+#Reduction of the late moves: grows with the remaining depth and the rank of the move in the ordering (at least 1, leaves at least 1 ply)
+lmr_table = [[max(1, min(depth - 2, int(LMR_BASE + math.log(depth) * math.log(move_number) / LMR_DIVISOR))) if depth > 2 and move_number > 0 else 0
+              for move_number in range(64)] for depth in range(64)]
+
+# -- Optimized NegaMax function with Move Ordering (transposition table move, MVV-LVA, killer moves, history), transposition table,
+#principal variation search, null-move pruning and late-move reductions --
+def findMoveNegaMaxAlphaBeta(board, depth, alpha, beta, turnColor, ply=0):
+    global nextMove, nextScore, search_nodes
+    search_nodes += 1
+    if search_deadline is not None and (stop_flag.value or time.time() >= search_deadline):
+        raise SearchTimeout()
+
+    if depth <= 0:
+        if QUIESCENCE:
+            return quiescence(board, alpha, beta, turnColor, ply)
+        if ply > search_stats['seldepth']:
+            search_stats['seldepth'] = ply
+        return turnColor * evaluate_leaf(board)
+
+    #Look up the position in the transposition table
+    alpha_original = alpha
+    key = zobrist_key(board)
+    tt_move = None
+    entry = transposition_table.probe(key)
+    search_stats['tt_probes'] += 1
+    if entry is not None:
+        search_stats['tt_hits'] += 1
+        tt_depth, tt_flag, tt_score, tt_move = entry
+        #The stored score can be reused if it comes from a search at least as deep (never at the root, which must return a move)
+        if ply > 0 and tt_depth >= depth:
+            if tt_flag == EXACT:
+                return tt_score
+            elif tt_flag == LOWERBOUND:
+                alpha = max(alpha, tt_score)
+            elif tt_flag == UPPERBOUND:
+                beta = min(beta, tt_score)
+            if alpha >= beta:
+                return tt_score
+
+    in_check = board.is_check()
+
+    #Null-move pruning: if the opponent cannot reach beta even when the side to move passes its turn, a real move will do even better.
+    #Not in check, not at a node of the principal variation, not twice in a row, and not in pawn endgames where passing could be
+    #better than any move (zugzwang).
+    if (NULL_MOVE_PRUNING and ply > 0 and depth >= NULL_MOVE_MIN_DEPTH and not in_check and beta - alpha <= NULL_WINDOW
+            and board.move_stack and board.peek() != chess.Move.null()
+            and board.occupied_co[board.turn] & ~(board.pawns | board.kings)):
+        push_move(board, chess.Move.null())
+        score = -findMoveNegaMaxAlphaBeta(board, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + NULL_WINDOW, -turnColor, ply + 1)
+        pop_move(board)
+        if score >= beta:
+            return beta if score >= CHECKMATE else score  #A mate found after a null move is not proven
+
+    maxScore = -1000
+    best_move = None
+
+    #The best move found by a previous search of this position (the principal variation at the root) is tried first
+    for move_number, move in enumerate(generate_ordered_moves(board, tt_move, ply)):
+        #Late-move reduction: quiet moves ordered after the hash move, the good captures and the killers are rarely the best
+        reduction = 0
+        if (LATE_MOVE_REDUCTIONS and depth >= LMR_MIN_DEPTH and move_number >= LMR_MIN_MOVES and not in_check
+                and not move.promotion and not board.is_capture(move) and not board.gives_check(move)):
+            reduction = lmr_table[min(depth, 63)][min(move_number, 63)]
+
+        push_move(board, move)
+        if best_move is None:
+            score = -findMoveNegaMaxAlphaBeta(board, depth - 1, -beta, -alpha, -turnColor, ply + 1)
+        else:
+            score = alpha + 1  #Forces the search at full depth when the move is not reduced
+            if reduction:
+                score = -findMoveNegaMaxAlphaBeta(board, depth - 1 - reduction, -alpha - NULL_WINDOW, -alpha, -turnColor, ply + 1)
+            if score > alpha:
+                if PVS:
+                    #Null window: only proves that the move is not better than alpha, and is searched again with the full window if it is
+                    score = -findMoveNegaMaxAlphaBeta(board, depth - 1, -alpha - NULL_WINDOW, -alpha, -turnColor, ply + 1)
+                    if alpha < score < beta:
+                        score = -findMoveNegaMaxAlphaBeta(board, depth - 1, -beta, -alpha, -turnColor, ply + 1)
+                else:
+                    score = -findMoveNegaMaxAlphaBeta(board, depth - 1, -beta, -alpha, -turnColor, ply + 1)
+        pop_move(board)
 
         if score > maxScore:
             maxScore = score
@@ -758,10 +1420,26 @@ def findMoveNegaMaxAlphaBeta(board, depth, alpha, beta, turnColor):
 
         alpha = max(alpha, maxScore)
         if alpha >= beta:
+            search_stats['cutoffs'] += 1
+            if move_number == 0:
+                search_stats['first_move_cutoffs'] += 1
+            if not board.is_capture(move) and not move.promotion:
+                update_move_ordering_tables(move, depth, ply)
             break
+
+    #Store the result with the type of bound it represents
+    if maxScore <= alpha_original:
+        flag = UPPERBOUND
+    elif maxScore >= beta:
+        flag = LOWERBOUND
+    else:
+        flag = EXACT
+    transposition_table.store(key, depth, flag, maxScore, best_move)
         
-    if depth == DEPTH:
+    if ply == 0:
+        nextScore = maxScore
         if best_move is not None:
+            nextMove = best_move
             return best_move
         else:
             # Fallback: return first legal move if something went wrong
@@ -774,37 +1452,99 @@ def findMoveNegaMaxAlphaBeta(board, depth, alpha, beta, turnColor):
                 return None
     return maxScore
 
-# -- Move Ordering function using MVV-LVA (Most Valuable Victim - Least Valuable Attacker) --
-def move_ordering(board, move, params):
-    target = board.piece_at(move.to_square)
-    if target:
-        symbol = target.symbol().upper()
-        #Map the piece symbols to the parameter names
-        piece_name_map = {
-            'P': 'pawn_value',
-            'N': 'knight_value',
-            'B': 'bishop_value',
-            'R': 'rook_value',
-            'Q': 'queen_value'
-        }
-        victim_value = params.get(piece_name_map.get(symbol, ''), 0)
-        
-        attacker = board.piece_at(move.from_square)
-        if attacker:
-            symbol_attacker = attacker.symbol().upper()
-            attacker_value = params.get(piece_name_map.get(symbol_attacker, ''), 0)
-        else:
-            attacker_value = 0
-        
-        return victim_value - attacker_value
+#At the horizon, a static evaluation in the middle of an exchange gives wrong results (e.g. the queen has just captured a pawn defended by another pawn).
+#The quiescence search continues with the captures only, until the position is quiet.
+#Stand pat: the side to move is not forced to capture, so the static evaluation is a lower bound of the score.
+
+# -- Quiescence search function (captures ordered by MVV-LVA) --
+def quiescence(board, alpha, beta, turnColor, ply=0):
+    global search_nodes
+    search_nodes += 1
+    if search_deadline is not None and (stop_flag.value or time.time() >= search_deadline):
+        raise SearchTimeout()
+    if ply > search_stats['seldepth']:
+        search_stats['seldepth'] = ply
+
+    in_check = QUIESCENCE_CHECK_EVASIONS and board.is_check()
+    if in_check:
+        #No stand pat in check: every evasion is searched
+        maxScore = -1000
+        moves = list(board.legal_moves)
+        if not moves:
+            return turnColor * evaluate_leaf(board)  #Checkmate
+    else:
+        stand_pat = turnColor * evaluate_leaf(board)
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        maxScore = stand_pat
+        moves = list(board.generate_legal_captures())
+
+    moves.sort(key=lambda move: capture_score(board, move), reverse=True)
 
-    #Non-capturing moves have lower priority
-    return 0
+    for move in moves:
+        #Delta pruning: even winning the captured piece with a margin, this capture cannot raise alpha
+        if not in_check and not move.promotion:
+            victim_type = chess.PAWN if board.is_en_passant(move) else board.piece_type_at(move.to_square)
+            if stand_pat + params[PIECE_VALUE_NAMES[victim_type]] + DELTA_MARGIN <= alpha:
+                continue
+
+        push_move(board, move)
+        score = -quiescence(board, -beta, -alpha, -turnColor, ply + 1)
+        pop_move(board)
+
+        if score > maxScore:
+            maxScore = score
+        alpha = max(alpha, maxScore)
+        if alpha >= beta:
+            break
 
-@lru_cache(maxsize=100000)
-def evaluate_board_cached(fen):
-    board = chess.Board(fen)
-    return evaluate_board(board, params)
+    return maxScore
+
+#Evaluation cache of the 'standard' evaluator: a fixed-size table indexed by the Zobrist key of the position, so no FEN string is built
+#and no board is parsed. Each slot holds the key and the score (float32) of the last position stored there, which replaces the previous one.
+#- evaluate_board also depends on the move number (king activity after move 40): the positions after move 40 get another key,
+#- the draws by repetition and by the 50-move rule depend on the moves played, not only on the position. They are never cached: the
+#  position is evaluated without its move history, and the 50-move rule is tested on the live board,
+#- the scores depend on params: the cache is cleared by set_params, and when params was changed in place (checked at the start of each
+#  search and at each miss, not at each lookup).
+#A slot only holds keys whose low bits are its index, so an empty slot holds its index with the lowest bit flipped, which no key can be.
+EVAL_CACHE_SIZE = 1 << 17  #Number of slots (power of 2): 1.5 MB
+LATE_GAME_KEY = 0x9E3779B97F4A7C15  #Combined with the key of the positions after move 40
+EMPTY_EVAL_CACHE_KEYS = np.arange(EVAL_CACHE_SIZE, dtype=np.uint64) ^ np.uint64(1)
+eval_cache_keys = EMPTY_EVAL_CACHE_KEYS.copy()
+eval_cache_scores = np.zeros(EVAL_CACHE_SIZE, dtype=np.float32)
+eval_cache_params = dict(params)  #Parameters the stored scores were computed with
+eval_cache_lookups = 0  #Number of lookups and of positions found since the start of the program
+eval_cache_hits = 0
+
+# -- Function that empties the evaluation cache --
+def clear_eval_cache():
+    global eval_cache_params
+    eval_cache_keys[:] = EMPTY_EVAL_CACHE_KEYS
+    eval_cache_params = dict(params)
+
+# -- Function that clears the evaluation cache if params was changed in place since the scores were stored --
+def check_eval_cache_params():
+    if params != eval_cache_params:
+        clear_eval_cache()
+
+def evaluate_board_cached(board):
+    global eval_cache_lookups, eval_cache_hits
+    if board.halfmove_clock >= 99 and board.can_claim_fifty_moves():
+        return DRAW
+    key = zobrist_key(board)
+    if board.fullmove_number > 40:
+        key ^= LATE_GAME_KEY
+    index = key & (EVAL_CACHE_SIZE - 1)
+    eval_cache_lookups += 1
+    if eval_cache_keys.item(index) == key:
+        eval_cache_hits += 1
+    else:
+        check_eval_cache_params()
+        eval_cache_keys[index] = key
+        eval_cache_scores[index] = evaluate_board(board.copy(stack=False), params)
+    return eval_cache_scores.item(index)  #Rounded to float32 on a miss too, so a score does not depend on the content of the cache
 
 # -- Parametric evaluation function that calculates the score of the position --
 #The parameters are used to adjust the importance of each criterion
@@ -0,0 +1,192 @@
+#Benchmark of the evaluation and of the search of parametric_chess_ai.py, on a fixed set of positions taken from the PGN corpus.
+#Usage: python bench.py [--depth 4] [--output bench.json] [--compare baseline.json]
+#The results are written as JSON (standard output by default), so two runs can be diffed:
+#- evaluation: evaluations per second of evaluate_board and of the bitboard and incremental evaluators,
+#- search: nodes per second, time to reach each depth, branching factor,
+#- signature: total number of nodes of the searches at the maximum depth. The search is deterministic (fixed depth, no time limit,
+#  tables cleared before each search), so the signature only changes when the search or the evaluation changes: a run whose
+#  signature differs from the baseline has changed the tree searched, even if it is as fast.
+#The positions are versioned: BENCH_VERSION must be increased whenever BENCH_POSITIONS change, since the results are not comparable.
+import argparse
+import contextlib
+import json
+import os
+import platform
+import sys
+import time
+import chess
+import chess.pgn
+
+BENCH_VERSION = 1
+BENCH_DEPTH = 4  #Maximum depth of the searches
+EVALUATION_REPETITIONS = 20  #Number of times each position is evaluated
+
+#Positions sampled by sample_bench_positions from the PGN files (100th game of each file): (phase, FEN)
+BENCH_POSITIONS = [
+    ('opening', 'r1b2rk1/ppB1ppbp/n5p1/3q4/3P4/4P3/PP3PPP/R2QKBNR w KQ - 1 9'),
+    ('middlegame', '2k3r1/Qp4q1/p1p2p2/5b1r/4p3/2N2R1P/PPP3PK/6R1 w - - 0 26'),
+    ('endgame', '8/p1b2pkp/p3p1p1/3bN3/1B1P1P2/1P2P3/P2K3P/8 w - - 0 25'),
+    ('opening', '1rbq1rk1/1pp1ppbp/p1np1np1/8/2PP4/1PN2NP1/P3PPBP/R1BQ1RK1 w - - 1 9'),
+    ('middlegame', '2bq1rk1/2p1n1bp/p2p2p1/2PP4/8/Q3P1p1/P2NP1BP/2RR2K1 w - - 0 26'),
+    ('endgame', '3r1k2/p4p1p/1b3p2/5N2/2R5/P5P1/1P2PP1P/6K1 b - - 0 29'),
+    ('opening', 'r1bqkb1r/1p1p1ppp/p3p1n1/8/3QPB2/2N3P1/PPP2P1P/R3KB1R w KQkq - 3 9'),
+    ('middlegame', '1r1r4/1p2knpp/p2pBp2/4pP2/4P2P/6P1/PPP1R3/2KR4 w - - 2 26'),
+    ('endgame', '3r4/r4kpp/p1Rp1p2/1p2pP2/4P2P/6P1/PPP5/2KR4 w - - 0 31'),
+    ('opening', 'r1bq1rk1/1pp2pbp/2np1np1/p3p3/2P5/2NP1NP1/PP2PPBP/1RBQ1RK1 w - - 0 9'),
+    ('middlegame', 'r5k1/5pbp/4n1p1/4p3/3pP3/3P1QP1/1r1B1P1P/3R2K1 w - - 2 26'),
+    ('endgame', '3b2k1/1b3p1p/p5p1/1p6/4p3/4N3/PPP2PPP/3B2K1 w - - 0 29'),
+    ('opening', 'rnb1k1r1/ppq1npQp/4p3/2ppP3/3P4/P1P5/2P2PPP/R1B1KBNR w KQq - 1 9'),
+    ('middlegame', '2kr4/1p3p2/2q1p3/1p2P2P/2npNPr1/P2Q3R/2P3P1/2B2K2 w - - 2 26'),
+    ('endgame', '4r1k1/1p5p/p1p2qp1/4p3/P1P1R3/1P2Q2P/2P3PK/8 w - - 0 38'),
+    ('opening', 'r1bq1rk1/ppp1npbp/3p1np1/3Pp3/2P1P3/2N2N2/PP2BPPP/R1BQ1RK1 w - - 1 9'),
+    ('middlegame', '3q2k1/6b1/r1npnrpp/PNp1p3/2P1P3/R7/3B1P1P/1Q1B1R1K w - - 3 26'),
+    ('endgame', '6k1/1B2np2/5p2/8/1R3K2/r7/8/8 w - - 0 63')
+]
+
+ENDGAME_PIECES = 4  #Maximum number of knights, bishops, rooks and queens (both colors) of an endgame position
+
+# -- Function that returns the phase of a position: 'opening', 'middlegame' or 'endgame' --
+def game_phase(board):
+    pieces = chess.popcount(board.occupied & ~(board.pawns | board.kings))
+    if pieces <= ENDGAME_PIECES:
+        return 'endgame'
+    return 'opening' if board.fullmove_number <= 10 else 'middlegame'
+
+# -- Function that samples one position of each phase from a game of each PGN file (used to build BENCH_POSITIONS) --
+#Opening: position after 8 moves, middlegame: after 25 moves, endgame: first endgame position with at least 10 half-moves left.
+def sample_bench_positions(pgn_paths, game_number=100):
+    positions = []
+    for pgn_path in pgn_paths:
+        with open(pgn_path, 'r', encoding='latin-1', errors='ignore') as pgn_file:
+            for _ in range(game_number - 1):
+                chess.pgn.skip_game(pgn_file)
+            found = {}
+            while len(found) < 3:
+                game = chess.pgn.read_game(pgn_file)
+                if game is None:
+                    break
+                board = game.board()
+                moves = list(game.mainline_moves())
+                for ply, move in enumerate(moves):
+                    phase = game_phase(board)
+                    if phase not in found and (
+                            (phase == 'opening' and ply == 16) or
+                            (phase == 'middlegame' and ply == 50) or
+                            (phase == 'endgame' and len(moves) - ply >= 10)):
+                        found[phase] = board.fen()
+                    board.push(move)
+        positions += [(phase, found[phase]) for phase in ('opening', 'middlegame', 'endgame') if phase in found]
+    return positions
+
+# -- Function that measures the evaluations per second of an evaluation function on the positions --
+def bench_evaluation(evaluate, boards, repetitions):
+    start = time.perf_counter()
+    for _ in range(repetitions):
+        for board in boards:
+            evaluate(board)
+    elapsed = time.perf_counter() - start
+    evaluations = repetitions * len(boards)
+    return {'evaluations': evaluations, 'time': round(elapsed, 4), 'evaluations_per_second': round(evaluations / elapsed)}
+
+# -- Function that runs the benchmark and returns the results (dictionary written as JSON) --
+def run_bench(depth=BENCH_DEPTH, repetitions=EVALUATION_REPETITIONS):
+    import parametric_chess_ai as engine
+    from bitboard_evaluation import evaluate_board_bitboard
+    from incremental_evaluation import IncrementalEvaluator
+
+    boards = [chess.Board(fen) for _, fen in BENCH_POSITIONS]
+
+    #Evaluation: the incremental evaluator is reset on each position, as at the root of a search
+    incremental_evaluator = IncrementalEvaluator()
+    def evaluate_incremental(board):
+        incremental_evaluator.reset(board)
+        return incremental_evaluator.evaluate(board, engine.params)
+    evaluation = {
+        'evaluate_board': bench_evaluation(lambda board: engine.evaluate_board(board, engine.params), boards, repetitions),
+        'bitboard': bench_evaluation(lambda board: evaluate_board_bitboard(board, engine.params), boards, repetitions),
+        'incremental': bench_evaluation(evaluate_incremental, boards, repetitions)
+    }
+
+    #Search: each depth is searched from scratch (iterative deepening up to that depth, tables cleared), so the time to depth
+    #and the number of nodes of a depth do not depend on the searches run before
+    nodes_by_depth = [0] * (depth + 1)
+    time_by_depth = [0.0] * (depth + 1)
+    positions = []
+    for (phase, fen), board in zip(BENCH_POSITIONS, boards):
+        for search_depth in range(1, depth + 1):
+            engine.transposition_table.clear()
+            start = time.perf_counter()
+            move = engine.findMoveIterativeDeepening(board, search_depth)
+            elapsed = time.perf_counter() - start
+            nodes_by_depth[search_depth] += engine.search_nodes
+            time_by_depth[search_depth] += elapsed
+        positions.append({'phase': phase, 'fen': fen, 'nodes': engine.search_nodes, 'time': round(elapsed, 4),
+                          'best_move': move.uci() if move else None, 'score': round(engine.search_info['score'], 4)})
+
+    nodes = nodes_by_depth[depth]
+    search_time = time_by_depth[depth]
+    search = {
+        'nodes': nodes,
+        'time': round(search_time, 4),
+        'nodes_per_second': round(nodes / search_time),
+        'time_to_depth': {str(d): round(time_by_depth[d], 4) for d in range(1, depth + 1)},
+        'nodes_by_depth': {str(d): nodes_by_depth[d] for d in range(1, depth + 1)},
+        #Ratio of the nodes of a depth to the nodes of the previous depth, and its geometric mean over the depths
+        'branching_factor': {str(d): round(nodes_by_depth[d] / nodes_by_depth[d - 1], 3) for d in range(2, depth + 1)},
+        'effective_branching_factor': round((nodes / nodes_by_depth[1]) ** (1 / (depth - 1)), 3) if depth > 1 else None,
+        'positions': positions
+    }
+
+    return {
+        'bench_version': BENCH_VERSION,
+        'depth': depth,
+        'signature': nodes,
+        'config': {
+            'evaluator': engine.EVALUATOR,
+            'quiescence': engine.QUIESCENCE,
+            'pvs': engine.PVS,
+            'aspiration_window': engine.ASPIRATION_WINDOW,
+            'null_move_pruning': engine.NULL_MOVE_PRUNING,
+            'late_move_reductions': engine.LATE_MOVE_REDUCTIONS,
+            'tt_size_mb': engine.TT_SIZE_MB
+        },
+        'system': {'python': platform.python_version(), 'python_chess': chess.__version__, 'machine': platform.machine()},
+        'evaluation': evaluation,
+        'search': search
+    }
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark of the evaluation and of the search")
+    parser.add_argument('--depth', type=int, default=BENCH_DEPTH, help="maximum depth of the searches")
+    parser.add_argument('--output', help="JSON file of the results (standard output by default)")
+    parser.add_argument('--compare', help="JSON file of a previous run: exit with status 1 if the signature differs")
+    parser.add_argument('--sample', action='store_true', help="print positions sampled from the PGN files (to update BENCH_POSITIONS)")
+    args = parser.parse_args()
+
+    if args.sample:
+        from opening_book import PGN_FOLDER_PATH, PGN_FILE_NAMES
+        pgn_paths = [os.path.join(PGN_FOLDER_PATH, name) for name in PGN_FILE_NAMES if os.path.exists(os.path.join(PGN_FOLDER_PATH, name))]
+        for phase, fen in sample_bench_positions(pgn_paths):
+            print(f"    ('{phase}', '{fen}'),")
+        sys.exit(0)
+
+    #The messages of the engine (iterations of the search...) are not shown, the standard output only gets the JSON
+    os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        results = run_bench(args.depth)
+
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as json_file:
+            json_file.write(output + '\n')
+    else:
+        print(output)
+
+    print(f"Signature {results['signature']}: {results['search']['nodes_per_second']} nodes/s, "
+          f"{results['evaluation']['evaluate_board']['evaluations_per_second']} evaluate_board/s", file=sys.stderr)
+    if args.compare:
+        with open(args.compare, 'r') as json_file:
+            baseline = json.load(json_file)
+        if (baseline['bench_version'], baseline['depth'], baseline['signature']) != (BENCH_VERSION, args.depth, results['signature']):
+            print(f"Signature differs from {args.compare}: {baseline['signature']} (version {baseline['bench_version']}, depth {baseline['depth']})", file=sys.stderr)
+            sys.exit(1)
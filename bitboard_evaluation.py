@@ -0,0 +1,175 @@
+#Bitboard version of the evaluate_board function of parametric_chess_ai.py and AIChessBoard.py.
+#python-chess stores the position as 64-bit integers (one bit per square): board.pawns, board.rooks, board.occupied_co[chess.WHITE]...
+#With precomputed masks of files, adjacent files and front spans, each evaluation term is a few AND and popcount operations
+#instead of loops over the 64 squares with board.piece_at and string comparisons.
+#The score is the same as evaluate_board for the same params (up to the order of the floating point additions).
+#Run this file to check the parity with evaluate_board on the positions of the PGN corpus.
+import chess
+import chess.pgn
+import math
+import os
+import sys
+
+CHECKMATE = 1000  #Same values as the engine
+DRAW = 0
+
+#Parameter giving the material value of each piece type (the king has no material value)
+PIECE_VALUE_NAMES = {
+    chess.PAWN: 'pawn_value',
+    chess.KNIGHT: 'knight_value',
+    chess.BISHOP: 'bishop_value',
+    chess.ROOK: 'rook_value',
+    chess.QUEEN: 'queen_value'
+}
+
+#Squares used by the evaluation terms
+BB_CENTER = chess.BB_D4 | chess.BB_E4 | chess.BB_D5 | chess.BB_E5
+BB_KING_SAFETY = chess.BB_G1 | chess.BB_G8 | chess.BB_C1 | chess.BB_C8
+BB_OUTPOSTS = (chess.BB_FILE_C | chess.BB_FILE_D | chess.BB_FILE_E | chess.BB_FILE_F) & (chess.BB_RANK_4 | chess.BB_RANK_5 | chess.BB_RANK_6)
+
+#Files next to each file (used for isolated pawns)
+BB_ADJACENT_FILES = [
+    (chess.BB_FILES[file - 1] if file > 0 else 0) | (chess.BB_FILES[file + 1] if file < 7 else 0)
+    for file in range(8)
+]
+
+# -- Function that computes the squares in front of a pawn, on its file and the adjacent files (used for passed pawns) --
+def front_span(color, square):
+    file = chess.square_file(square)
+    rank = chess.square_rank(square)
+    ranks = range(rank + 1, 8) if color == chess.WHITE else range(0, rank)
+    mask = 0
+    for r in ranks:
+        mask |= chess.BB_RANKS[r]
+    return mask & (chess.BB_FILES[file] | BB_ADJACENT_FILES[file])
+
+BB_FRONT_SPAN = {color: [front_span(color, square) for square in chess.SQUARES] for color in chess.COLORS}
+
+# -- Function that returns the doubled, isolated and passed pawns (White minus Black) of a pawn structure --
+#As in evaluate_piece_specifics, the pawns of both colors are taken into account for isolated and passed pawns.
+def pawn_structure(white_pawns, black_pawns):
+    all_pawns = white_pawns | black_pawns
+    doubled = isolated = passed = 0
+    for color, pawns in ((chess.WHITE, white_pawns), (chess.BLACK, black_pawns)):
+        sign = 1 if color == chess.WHITE else -1
+        files = 0
+        for file in range(8):
+            pawns_on_file = pawns & chess.BB_FILES[file]
+            if pawns_on_file:
+                files += 1
+                if not all_pawns & BB_ADJACENT_FILES[file]:
+                    isolated += sign * chess.popcount(pawns_on_file)
+        doubled += sign * (chess.popcount(pawns) - files)
+        for square in chess.scan_forward(pawns):
+            if not all_pawns & BB_FRONT_SPAN[color][square]:
+                passed += sign
+    return doubled, isolated, passed
+
+# -- Function that detects the end of the game (same result as the checks of evaluate_board), returns None if the game goes on --
+#The costly draw claims are only tested when they are possible.
+def evaluate_end_of_game(board):
+    if not any(board.generate_legal_moves()):
+        if board.is_check():
+            return -CHECKMATE if board.turn == chess.WHITE else CHECKMATE
+        return DRAW  #Stalemate
+    #A position cannot occur again within less than 4 reversible half-moves
+    if board.halfmove_clock >= 4 and board.can_claim_threefold_repetition():
+        return DRAW
+    if board.halfmove_clock >= 99 and board.can_claim_fifty_moves():
+        return DRAW
+    return None
+
+# -- Function that evaluates the terms computed from the whole position at each evaluation (kings, bishops and attacks) --
+def evaluate_position_terms(board, params):
+    score = params['king_safety_bonus'] * chess.popcount(board.kings & BB_KING_SAFETY)
+
+    #Pieces that can be captured by the side to move
+    captures = sum(1 for _ in board.generate_legal_moves(chess.BB_ALL, board.occupied_co[not board.turn]))
+    score += params['attacked_piece_penalty'] * captures * (1 if board.turn == chess.WHITE else -1)
+
+    white_king = board.kings & board.occupied_co[chess.WHITE]
+    black_king = board.kings & board.occupied_co[chess.BLACK]
+    if board.fullmove_number > 40:
+        if white_king:
+            score += params['king_activity_endgame'] * (7 - chess.square_rank(chess.lsb(white_king)))
+        if black_king:
+            score -= params['king_activity_endgame'] * chess.square_rank(chess.lsb(black_king))
+
+    #Bishop pair: the sign is given by the color of the bishop on the highest square (first bishop of board.piece_map())
+    if chess.popcount(board.bishops) >= 2:
+        first_bishop = chess.BB_SQUARES[chess.msb(board.bishops)]
+        score += params['bishop_pair_bonus'] if board.occupied_co[chess.WHITE] & first_bishop else -params['bishop_pair_bonus']
+
+    if white_king & BB_CENTER:
+        score += params['king_proximity_to_center_endgame']
+    if black_king & BB_CENTER:
+        score -= params['king_proximity_to_center_endgame']
+
+    return score
+
+# -- Parametric evaluation function working on bitboards --
+def evaluate_board_bitboard(board, params):
+    end_of_game = evaluate_end_of_game(board)
+    if end_of_game is not None:
+        return end_of_game
+
+    white = board.occupied_co[chess.WHITE]
+    black = board.occupied_co[chess.BLACK]
+    score = 0
+
+    for piece_type, name in PIECE_VALUE_NAMES.items():
+        pieces = board.pieces_mask(piece_type, chess.WHITE) | board.pieces_mask(piece_type, chess.BLACK)
+        score += params[name] * (chess.popcount(pieces & white) - chess.popcount(pieces & black))
+
+    #Pawn structure (evaluate_pawn_structure counts the doubled pawns once per file, hence the factor 8)
+    doubled, isolated, passed = pawn_structure(board.pawns & white, board.pawns & black)
+    score += 8 * params['double_pawn_penalty'] * doubled
+    score -= params['isolated_pawn_penalty'] * isolated
+    score += params['passed_pawn_bonus'] * passed
+
+    score += params['center_control_bonus'] * chess.popcount(board.occupied & BB_CENTER)
+    score += params['knight_outpost_bonus'] * (chess.popcount(board.knights & white & BB_OUTPOSTS) - chess.popcount(board.knights & black & BB_OUTPOSTS))
+
+    #Every rook gets the bonus of every open and semi-open file (as in evaluate_rook_open_file)
+    rook_balance = chess.popcount(board.rooks & white) - chess.popcount(board.rooks & black)
+    if rook_balance:
+        open_files = semi_open_files = 0
+        for file_mask in chess.BB_FILES:
+            pieces_on_file = chess.popcount(board.occupied & file_mask)
+            if pieces_on_file == 0:
+                open_files += 1
+            elif pieces_on_file == 1:
+                semi_open_files += 1
+        score += rook_balance * (params['rook_open_file_bonus'] * open_files + params['rook_semi_open_file_bonus'] * semi_open_files)
+
+    score += evaluate_position_terms(board, params)
+
+    return score
+
+# -- Parity check against a reference evaluation on the positions of PGN games --
+#Returns the number of positions checked, raises an AssertionError on the first difference.
+def check_parity(reference_evaluate, params, pgn_paths, max_games_per_file=100, tolerance=1e-9):
+    positions = 0
+    for pgn_path in pgn_paths:
+        with open(pgn_path, 'r', encoding='latin-1', errors='ignore') as pgn_file:
+            for _ in range(max_games_per_file):
+                game = chess.pgn.read_game(pgn_file)
+                if game is None:
+                    break
+                board = game.board()
+                for move in game.mainline_moves():
+                    board.push(move)
+                    expected = reference_evaluate(board, params)
+                    score = evaluate_board_bitboard(board, params)
+                    assert math.isclose(score, expected, abs_tol=tolerance), f"Bitboard evaluation {score} differs from evaluate_board {expected} for {board.fen()}"
+                    positions += 1
+    return positions
+
+if __name__ == '__main__':
+    from parametric_chess_ai import evaluate_board, params
+    from opening_book import PGN_FOLDER_PATH, PGN_FILE_NAMES
+
+    max_games_per_file = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+    pgn_paths = [os.path.join(PGN_FOLDER_PATH, name) for name in PGN_FILE_NAMES if os.path.exists(os.path.join(PGN_FOLDER_PATH, name))]
+    positions = check_parity(evaluate_board, params, pgn_paths, max_games_per_file)
+    print(f"Bitboard evaluation matches evaluate_board on {positions} positions")
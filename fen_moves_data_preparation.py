@@ -1,8 +1,13 @@
-#Prepare the FEN and move data from grandmaster games and save the data to master_moves_data.json.
+#Prepare the position and move data from grandmaster games and save the data to master_moves_data.bin (format described in training_data.py).
+#The PGN files are split into chunks of games (byte offsets of the games in the file), parsed in parallel on a pool of processes,
+#and the records are written to the file as soon as a chunk is parsed, so the memory used does not depend on the size of the corpus.
 import chess
 import chess.pgn
-import json
+from collections import deque
+import io
 import os
+from multiprocessing import Pool, cpu_count
+from training_data import encode_position, TRAINING_DATA_FILE
 
 #List of specific PGN file names to process
 PGN_FILE_NAMES = [
@@ -18,28 +23,86 @@ PGN_FILE_NAMES = [
 #Path to the PGN folder within the current working directory
 PGN_FOLDER_PATH = os.path.join(os.getcwd(), 'PGN')
 
-fen_moves_data = [] #Initialize a list to store (FEN, SAN move) pairs from each position in the games.
-total_games = 0 #Counter to track the total number of games processed.
+OUTPUT_FILE = TRAINING_DATA_FILE
+GAMES_PER_CHUNK = 500 #Number of games parsed by a worker in one task
+CHUNKS_IN_FLIGHT_PER_PROCESS = 2 #Number of chunks submitted to each process ahead of the chunk being written (bounds the memory used)
 
-for pgn_file_name in PGN_FILE_NAMES: #Loop to process each PGN file of grandmasters.
-    pgn_path = os.path.join(PGN_FOLDER_PATH, pgn_file_name)
-    with open(pgn_path, 'r', encoding='latin-1', errors='ignore') as pgn_file: #Open each PGN file for reading with encoding error handling.
-        while True: #Loop to read each game in the PGN file.
-            game = chess.pgn.read_game(pgn_file) #Read the next game from the PGN file.
-            if game is None: #Check for end of PGN file (no more games left).
-                break
+# -- Function that splits a PGN file into chunks of games, given as (path, start offset, end offset) --
+#Only the lines are scanned for the start of the games ([Event tag), the moves are not parsed here.
+def pgn_chunks(pgn_path, games_per_chunk=GAMES_PER_CHUNK):
+    with open(pgn_path, 'rb') as pgn_file:
+        chunk_start = 0
+        games = 0
+        offset = 0
+        for line in pgn_file:
+            if line.startswith(b'[Event '):
+                if games == games_per_chunk: #The chunk is full: the game starting here begins the next chunk.
+                    yield (pgn_path, chunk_start, offset)
+                    chunk_start = offset
+                    games = 0
+                games += 1
+            offset += len(line)
+        if games:
+            yield (pgn_path, chunk_start, offset)
 
-            total_games += 1 #Increment the counter of processed games.
-            board = game.board() #Initialize the board to the starting position for each game.
+# -- Worker function: parses the games of a chunk and returns the number of games, the number of positions and the encoded records --
+def parse_chunk(chunk):
+    pgn_path, start, end = chunk
+    with open(pgn_path, 'rb') as pgn_file:
+        pgn_file.seek(start)
+        text = pgn_file.read(end - start).decode('latin-1', errors='ignore') #Same encoding as the original files.
 
-            for move in game.mainline_moves(): #Loop through each move in the game.
-                fen = board.fen() #Get the FEN position before each move.
-                san_move = board.san(move) #Convert the move to SAN (Standard Algebraic Notation).
-                fen_moves_data.append({"fen": fen, "move": san_move}) #Store the (FEN, move) pair in the fen_moves_data list.
-                board.push(move) #Update the board with the move played to advance the game.
+    pgn_text = io.StringIO(text)
+    records = []
+    games = 0
+    while True: #Loop to read each game of the chunk.
+        game = chess.pgn.read_game(pgn_text)
+        if game is None: #End of the chunk.
+            break
 
-print(f"Total games processed: {total_games}") #Display the total number of games processed once all files are parsed. 29041 games are processed.
+        games += 1
+        board = game.board() #Initialize the board to the starting position for each game.
+        result = game.headers.get('Result')
+        for move in game.mainline_moves(): #Loop through each move in the game.
+            records.append(encode_position(board, move, result).tobytes()) #Store the position before the move, the move played and the result of the game.
+            board.push(move) #Update the board with the move played to advance the game.
+    return games, len(records), b''.join(records)
 
-with open('master_moves_data.json', 'w') as json_file: #Save the extracted data (FEN and moves) to a JSON file with indentation for readability.
-    json.dump(fen_moves_data, json_file, indent=4)
-print("FEN and moves data saved to master_moves_data.json") #Confirmation message that the data has been successfully saved.
\ No newline at end of file
+# -- Function that yields the chunks of all the PGN files --
+def all_chunks(PGN_FILE_NAMES):
+    for pgn_file_name in PGN_FILE_NAMES:
+        pgn_path = os.path.join(PGN_FOLDER_PATH, pgn_file_name)
+        if not os.path.exists(pgn_path):
+            print(f"{pgn_file_name} not found, skipped.")
+            continue
+        yield from pgn_chunks(pgn_path)
+
+# -- Function that parses the PGN files in parallel and streams the records to the output file --
+def prepare_data(PGN_FILE_NAMES, output_file=OUTPUT_FILE, processes=None):
+    total_games = 0 #Counter to track the total number of games processed.
+    total_records = 0
+    processes = processes or cpu_count()
+    #The chunks are written in order, so the output does not depend on the number of processes. At most
+    #CHUNKS_IN_FLIGHT_PER_PROCESS chunks per process are submitted ahead of the oldest one: the chunks parsed behind a slow chunk
+    #wait in memory for it to be written, and their number must not grow with the size of the corpus.
+    pending = deque()
+    with open(output_file, 'wb') as data_file, Pool(processes) as pool:
+        def write_oldest_chunk():
+            nonlocal total_games, total_records
+            games, count, records = pending.popleft().get()
+            total_games += games
+            total_records += count
+            data_file.write(records)
+
+        for chunk in all_chunks(PGN_FILE_NAMES):
+            if len(pending) >= processes * CHUNKS_IN_FLIGHT_PER_PROCESS:
+                write_oldest_chunk()
+            pending.append(pool.apply_async(parse_chunk, (chunk,)))
+        while pending:
+            write_oldest_chunk()
+    return total_games, total_records
+
+if __name__ == '__main__':
+    total_games, total_records = prepare_data(PGN_FILE_NAMES)
+    print(f"Total games processed: {total_games}") #Display the total number of games processed once all files are parsed. 29041 games are processed.
+    print(f"Positions and moves data saved to {OUTPUT_FILE} ({total_records} positions)") #Confirmation message that the data has been successfully saved.
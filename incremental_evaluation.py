@@ -0,0 +1,125 @@
+#Incremental version of the evaluate_board function of parametric_chess_ai.py and AIChessBoard.py.
+#Instead of rescanning the 64 squares for each term at every leaf of the search, the evaluator keeps the piece counts,
+#the occupancy of the center and of the files, the knight outposts and the pawn structure up to date when a move is pushed or popped.
+#A leaf evaluation then only costs the terms that depend on the legal moves (attacks and end of game detection).
+#The score is the same as evaluate_board for the same params (up to the order of the floating point additions).
+import chess
+from bitboard_evaluation import PIECE_VALUE_NAMES, BB_CENTER, BB_OUTPOSTS, pawn_structure, evaluate_end_of_game, evaluate_position_terms
+
+PAWN_TABLE_SIZE = 100000  #Maximum number of pawn structures kept in memory
+
+# -- Evaluator updated on push/pop during the search --
+#Usage: call reset(board) before the search, push(board, move) just before board.push(move), pop() just after board.pop(),
+#and evaluate(board, params) at the leaves.
+class IncrementalEvaluator():
+    def __init__(self, board=None):
+        self.pawn_table = {}  #Pawn structure terms already computed, indexed by the pawn bitboards
+        self.pawn_table_lookups = 0  #Number of lookups of the pawn table, and number of pawn structures found (statistics of the search)
+        self.pawn_table_hits = 0
+        self.reset(board if board is not None else chess.Board())
+
+    # -- Function that computes the state from scratch --
+    def reset(self, board):
+        self.piece_balance = [0] * 7  #Number of White pieces minus number of Black pieces, by piece type
+        self.center_count = 0  #Number of pieces (of both colors) on the central squares
+        self.outpost_balance = 0  #White knights minus Black knights on outposts
+        self.file_counts = [0] * 8  #Number of pieces (of both colors) on each file
+        self.pawns = {chess.WHITE: 0, chess.BLACK: 0}  #Pawn bitboards
+        self.stack = []
+        for square, piece in board.piece_map().items():
+            self.update_piece(square, piece.piece_type, piece.color, 1)
+
+    # -- Function that adds (sign = 1) or removes (sign = -1) a piece --
+    def update_piece(self, square, piece_type, color, sign):
+        side = sign if color == chess.WHITE else -sign
+        self.piece_balance[piece_type] += side
+        self.file_counts[chess.square_file(square)] += sign
+        if BB_CENTER & chess.BB_SQUARES[square]:
+            self.center_count += sign
+        if piece_type == chess.KNIGHT and BB_OUTPOSTS & chess.BB_SQUARES[square]:
+            self.outpost_balance += side
+        elif piece_type == chess.PAWN:
+            self.pawns[color] ^= chess.BB_SQUARES[square]
+
+    # -- Function to call before board.push(move): applies the changes made by the move --
+    def push(self, board, move):
+        self.stack.append((self.piece_balance[:], self.center_count, self.outpost_balance, self.file_counts[:], self.pawns[chess.WHITE], self.pawns[chess.BLACK]))
+        if move == chess.Move.null():
+            return
+
+        color = board.turn
+        piece_type = board.piece_type_at(move.from_square)
+
+        #Captured piece (the captured pawn of an en passant is not on the destination square)
+        if board.is_en_passant(move):
+            captured_square = move.to_square - 8 if color == chess.WHITE else move.to_square + 8
+            self.update_piece(captured_square, chess.PAWN, not color, -1)
+        elif board.is_castling(move):
+            #The rook jumps over the king
+            rank = chess.square_rank(move.from_square)
+            if board.is_kingside_castling(move):
+                rook_from, rook_to = chess.square(7, rank), chess.square(5, rank)
+                king_to = chess.square(6, rank)
+            else:
+                rook_from, rook_to = chess.square(0, rank), chess.square(3, rank)
+                king_to = chess.square(2, rank)
+            self.update_piece(move.from_square, chess.KING, color, -1)
+            self.update_piece(rook_from, chess.ROOK, color, -1)
+            self.update_piece(king_to, chess.KING, color, 1)
+            self.update_piece(rook_to, chess.ROOK, color, 1)
+            return
+        else:
+            captured_type = board.piece_type_at(move.to_square)
+            if captured_type:
+                self.update_piece(move.to_square, captured_type, not color, -1)
+
+        self.update_piece(move.from_square, piece_type, color, -1)
+        self.update_piece(move.to_square, move.promotion or piece_type, color, 1)
+
+    # -- Function to call after board.pop(): restores the state before the move --
+    def pop(self):
+        self.piece_balance, self.center_count, self.outpost_balance, self.file_counts, white_pawns, black_pawns = self.stack.pop()
+        self.pawns = {chess.WHITE: white_pawns, chess.BLACK: black_pawns}
+
+    # -- Function that returns the doubled, isolated and passed pawns (White minus Black) of the current pawn structure --
+    def pawn_structure(self):
+        key = (self.pawns[chess.WHITE], self.pawns[chess.BLACK])
+        terms = self.pawn_table.get(key)
+        self.pawn_table_lookups += 1
+        if terms is None:
+            terms = pawn_structure(*key)
+            if len(self.pawn_table) >= PAWN_TABLE_SIZE:
+                self.pawn_table.clear()
+            self.pawn_table[key] = terms
+        else:
+            self.pawn_table_hits += 1
+        return terms
+
+    # -- Function that evaluates the current position (same score as evaluate_board) --
+    def evaluate(self, board, params):
+        end_of_game = evaluate_end_of_game(board)
+        if end_of_game is not None:
+            return end_of_game
+
+        score = 0
+        for piece_type, name in PIECE_VALUE_NAMES.items():
+            score += params[name] * self.piece_balance[piece_type]
+
+        #Pawn structure (evaluate_pawn_structure counts the doubled pawns once per file, hence the factor 8)
+        doubled, isolated, passed = self.pawn_structure()
+        score += 8 * params['double_pawn_penalty'] * doubled
+        score -= params['isolated_pawn_penalty'] * isolated
+        score += params['passed_pawn_bonus'] * passed
+
+        score += params['center_control_bonus'] * self.center_count
+        score += params['knight_outpost_bonus'] * self.outpost_balance
+
+        #Every rook gets the bonus of every open and semi-open file (as in evaluate_rook_open_file)
+        open_files = self.file_counts.count(0)
+        semi_open_files = self.file_counts.count(1)
+        score += self.piece_balance[chess.ROOK] * (params['rook_open_file_bonus'] * open_files + params['rook_semi_open_file_bonus'] * semi_open_files)
+
+        #Kings, bishop pair and attacks do not depend on a few pieces only: they are computed on the bitboards of the position
+        score += evaluate_position_terms(board, params)
+
+        return score
@@ -0,0 +1,341 @@
+#Self-play match between two configurations of the engine of parametric_chess_ai.py, played in parallel on a pool of processes.
+#Usage: python match.py --games 200 --a name=trained params=trained_parameters.json --b name=base [--depth 3 | --movetime 0.5 | --tc 60+0.5]
+#        [--openings PGN/Ding.pgn] [--sprt 0 10] [--pgn match.pgn] [--concurrency 4]
+#A configuration is a list of key=value settings:
+#- name: name of the player in the PGN (default: A / B),
+#- params: JSON file of evaluation parameters (e.g. trained_parameters.json, loaded with set_params), missing names keep the engine values,
+#- depth: maximum depth, movetime: seconds per move, tc: game clock in seconds with an increment (e.g. 60+0.5, budget from allocate_time),
+#- hash: size of the transposition table in MB,
+#- any upper-case setting of the engine (e.g. NULL_MOVE_PRUNING=False, EVALUATOR=bitboard, LMR_BASE=1.0).
+#--depth, --movetime and --tc give the default of both configurations.
+#Each opening of the suite is played twice, the configurations swapping colors, so that a lopsided opening does not favor either side.
+#The result is given as an Elo difference of A over B with its 95% error bar; with --sprt elo0 elo1, the match stops as soon as the
+#sequential probability ratio test accepts H0 (A is not elo1 stronger than B, but at most elo0) or H1 (A is at least elo1 stronger).
+import argparse
+import ast
+import datetime
+import itertools
+import json
+import math
+import os
+import sys
+import time
+from multiprocessing import Pool, cpu_count
+import chess
+import chess.pgn
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+import parametric_chess_ai as engine
+from opening_book import PGN_FOLDER_PATH, PGN_FILE_NAMES
+
+DEFAULT_DEPTH = 3  #Depth of the configurations without depth, movetime or tc
+OPENING_PLIES = 8  #Number of half-moves of the games of a PGN file played to get an opening position
+MAX_GAME_PLIES = 400  #Games still running after this number of half-moves are adjudicated as draws
+CONFIG_KEYS = ['name', 'params', 'depth', 'movetime', 'tc', 'hash']
+
+# -- Function that converts the settings key=value of a configuration to a dictionary --
+def parse_config(settings, name):
+    config = {'name': name, 'params': {}, 'depth': None, 'movetime': None, 'tc': None, 'hash': None, 'options': {}}
+    for setting in settings:
+        key, separator, value = setting.partition('=')
+        if not separator:
+            raise ValueError(f"expected key=value, got '{setting}'")
+        if key == 'name':
+            config['name'] = value
+        elif key == 'params':
+            with open(value, 'r') as json_file:
+                config['params'] = {name: value for name, value in json.load(json_file).items() if name in engine.params}
+        elif key in ('depth', 'hash'):
+            config[key] = int(value)
+        elif key == 'movetime':
+            config[key] = float(value)
+        elif key == 'tc':
+            clock, _, increment = value.partition('+')
+            config[key] = (float(clock), float(increment or 0))
+        elif key.isupper() and hasattr(engine, key):
+            try:
+                config['options'][key] = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                config['options'][key] = value  #Strings can be given without quotes (EVALUATOR=bitboard)
+        else:
+            raise ValueError(f"unknown setting '{key}' (expected one of {', '.join(CONFIG_KEYS)} or an upper-case setting of the engine)")
+    return config
+
+# -- Function that returns the description of the time control of a configuration (PGN TimeControl header) --
+def time_control(config):
+    if config['tc'] is not None:
+        clock, increment = config['tc']
+        return f"{clock:g}+{increment:g}"
+    if config['movetime'] is not None:
+        return f"{config['movetime']:g}/move"
+    return f"depth {config['depth'] or DEFAULT_DEPTH}"
+
+# -- Generator of the positions of an opening suite file, without duplicates --
+#PGN file: position after OPENING_PLIES half-moves of each game; other files: one FEN or EPD per line (# for comments).
+def read_openings(path, plies=OPENING_PLIES):
+    seen = set()
+    if path.lower().endswith('.pgn'):
+        with open(path, 'r', encoding='latin-1', errors='ignore') as pgn_file:
+            while True:
+                game = chess.pgn.read_game(pgn_file)
+                if game is None:
+                    break
+                board = game.board()
+                for move in itertools.islice(game.mainline_moves(), plies):
+                    board.push(move)
+                if board.ply() - game.board().ply() < plies or board.is_game_over():
+                    continue
+                fen = board.fen()
+                if fen not in seen:
+                    seen.add(fen)
+                    yield fen
+    else:
+        with open(path, 'r') as opening_file:
+            for line in opening_file:
+                line = line.strip()
+                if not line or line.startswith('#'):
+                    continue
+                try:
+                    board = chess.Board(line)
+                except ValueError:
+                    board, _ = chess.Board.from_epd(line)
+                fen = board.fen()
+                if fen not in seen:
+                    seen.add(fen)
+                    yield fen
+
+# -- Function that returns count openings, taken in turn from each file of the suite (repeated if the suite is too small) --
+def load_openings(paths, count, plies=OPENING_PLIES):
+    generators = [read_openings(path, plies) for path in paths]
+    openings = []
+    while generators and len(openings) < count:
+        for generator in list(generators):
+            fen = next(generator, None)
+            if fen is None:
+                generators.remove(generator)
+            elif len(openings) < count:
+                openings.append(fen)
+    if not openings:
+        raise ValueError("the opening suite is empty")
+    return [openings[i % len(openings)] for i in range(count)]
+
+# -- Elo difference corresponding to an expected score --
+def elo_from_score(score):
+    if score <= 0:
+        return -math.inf
+    if score >= 1:
+        return math.inf
+    return -400 * math.log10(1 / score - 1)
+
+def score_from_elo(elo):
+    return 1 / (1 + 10 ** (-elo / 400))
+
+# -- Function that returns the score of A, its variance per game, and the Elo difference with its 95% confidence interval --
+def elo_estimate(wins, draws, losses):
+    games = wins + draws + losses
+    score = (wins + 0.5 * draws) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin = 1.96 * math.sqrt(variance / games)
+    return score, variance, elo_from_score(score), elo_from_score(score - margin), elo_from_score(score + margin)
+
+# -- Log-likelihood ratio of H1 (Elo difference elo1) against H0 (elo0), normal approximation of the trinomial results --
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    #The variance estimated from a few games is not reliable: the test waits for at least one win, one draw and one loss (as cutechess-cli)
+    if wins == 0 or draws == 0 or losses == 0:
+        return 0.0
+    games = wins + draws + losses
+    score, variance, _, _, _ = elo_estimate(wins, draws, losses)
+    score0, score1 = score_from_elo(elo0), score_from_elo(elo1)
+    return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+# -- Bounds of the log-likelihood ratio: H0 is accepted below the lower one, H1 above the upper one --
+def sprt_bounds(alpha, beta):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+#Worker processes: the engine is a module with global settings, so each move sets the settings of the configuration to move.
+#The transposition table is cleared before each move: the two configurations never share the results of their searches.
+match_configs = None
+current_params = None
+
+def init_match_worker(configs):
+    global match_configs
+    sys.stdout = open(os.devnull, 'w')  #The messages of the engine are not shown
+    engine.opening_book = None  #The openings come from the suite, then both configurations search every move
+    engine.SEARCH_PROCESSES = 1  #The workers of a pool cannot start their own pool
+    #The settings changed by one configuration keep the value of the engine for the other one
+    default_params = dict(engine.params)
+    default_options = {key: getattr(engine, key) for config in configs for key in config['options']}
+    match_configs = []
+    for config in configs:
+        config = dict(config)
+        config['params'] = {**default_params, **config['params']}
+        config['options'] = {**default_options, **config['options']}
+        config['hash'] = config['hash'] or engine.TT_SIZE_MB
+        match_configs.append(config)
+
+# -- Function that sets the settings of a configuration in the engine --
+def apply_config(config):
+    global current_params
+    if config['params'] != current_params:
+        engine.set_params(config['params'])
+        current_params = config['params']
+    for key, value in config['options'].items():
+        setattr(engine, key, value)
+    if engine.transposition_table.size_mb != config['hash']:
+        engine.transposition_table.resize(config['hash'])
+    engine.transposition_table.clear()
+
+# -- Worker function: plays one game from an opening, returns its result (from White's point of view), termination and PGN --
+def play_match_game(task):
+    round_number, opening_fen, white_index = task
+    players = {chess.WHITE: match_configs[white_index], chess.BLACK: match_configs[1 - white_index]}
+    clocks = {color: config['tc'][0] if config['tc'] is not None else None for color, config in players.items()}
+    board = chess.Board(opening_fen)
+    start_ply = board.ply()
+    comments = []
+    result, termination = None, None
+
+    while result is None:
+        outcome = board.outcome(claim_draw=True)
+        if outcome is not None:
+            result, termination = outcome.result(), outcome.termination.name.lower().replace('_', ' ')
+            break
+        if board.ply() - start_ply >= MAX_GAME_PLIES:
+            result, termination = '1/2-1/2', 'adjudication'
+            break
+
+        config = players[board.turn]
+        apply_config(config)
+        if config['tc'] is not None:
+            time_limit = engine.allocate_time(clocks[board.turn], config['tc'][1])
+        else:
+            time_limit = config['movetime']
+        max_depth = config['depth'] if config['depth'] is not None or time_limit is not None else DEFAULT_DEPTH
+
+        infos = []
+        start_time = time.time()
+        move = engine.AI.AI_move(board, time_limit, max_depth, info_callback=lambda info: infos.append(dict(info)))
+        elapsed = time.time() - start_time
+        if move is None:
+            result, termination = ('0-1' if board.turn == chess.WHITE else '1-0'), 'no move'
+            break
+
+        if clocks[board.turn] is not None:
+            clocks[board.turn] -= elapsed
+            if clocks[board.turn] < 0:
+                #Loss on time, unless the opponent cannot checkmate
+                if board.has_insufficient_material(not board.turn):
+                    result = '1/2-1/2'
+                else:
+                    result = '0-1' if board.turn == chess.WHITE else '1-0'
+                termination = 'time forfeit'
+                break
+            clocks[board.turn] += config['tc'][1]
+
+        #Comment of the move: score for the side to move / depth and time, as written by the usual tournament managers
+        if infos:
+            score = infos[-1]['score'] * (1 if board.turn == chess.WHITE else -1)
+            comments.append(f"{score:+.2f}/{infos[-1]['depth']} {elapsed:.2f}s")
+        else:
+            comments.append(f"#1 {elapsed:.2f}s")  #Mate in one, found before the search
+        board.push(move)
+
+    game = chess.pgn.Game.from_board(board)
+    for node, comment in zip(game.mainline(), comments):
+        node.comment = comment
+    game.headers['Event'] = 'Self-play match'
+    game.headers['Site'] = 'match.py'
+    game.headers['Date'] = datetime.date.today().strftime('%Y.%m.%d')
+    game.headers['Round'] = str(round_number)
+    game.headers['White'] = players[chess.WHITE]['name']
+    game.headers['Black'] = players[chess.BLACK]['name']
+    game.headers['Result'] = result
+    game.headers['TimeControl'] = time_control(players[chess.WHITE])
+    game.headers['Termination'] = termination
+    return round_number, white_index, result, termination, str(game)
+
+# -- Function that plays the match and returns the wins, draws and losses of A --
+def run_match(configs, openings, games, concurrency, pgn_path=None, sprt=None, alpha=0.05, beta=0.05):
+    #Game 2k and 2k+1 are played from the same opening, A having White in the first one
+    tasks = [(i + 1, openings[i // 2], i % 2) for i in range(games)]
+    wins = draws = losses = 0
+    terminations = {}
+    bounds = sprt_bounds(alpha, beta) if sprt is not None else None
+    pgn_file = open(pgn_path, 'w') if pgn_path else None
+    start_time = time.time()
+    try:
+        with Pool(concurrency, initializer=init_match_worker, initargs=(configs,)) as pool:
+            for round_number, white_index, result, termination, pgn in pool.imap_unordered(play_match_game, tasks):
+                if pgn_file:
+                    pgn_file.write(pgn + '\n\n')
+                    pgn_file.flush()
+                a_score = {'1-0': 1, '0-1': 0}.get(result, 0.5)
+                if white_index == 1:
+                    a_score = 1 - a_score
+                wins += a_score == 1
+                draws += a_score == 0.5
+                losses += a_score == 0
+                terminations[termination] = terminations.get(termination, 0) + 1
+
+                played = wins + draws + losses
+                line = f"Game {round_number} ({configs[white_index]['name']} - {configs[1 - white_index]['name']}): {result} {termination}. "
+                line += f"Score of {configs[0]['name']} vs {configs[1]['name']}: {wins} - {losses} - {draws} [{played}/{games}]"
+                if sprt is not None:
+                    llr = sprt_llr(wins, draws, losses, *sprt)
+                    line += f", LLR {llr:.2f} ({bounds[0]:.2f}, {bounds[1]:.2f})"
+                    if not bounds[0] < llr < bounds[1]:
+                        print(line)
+                        print(f"SPRT: H{1 if llr >= bounds[1] else 0} accepted after {played} games")
+                        break  #Leaving the with block terminates the games still running
+                print(line)
+    except KeyboardInterrupt:
+        print("Match interrupted")
+    finally:
+        if pgn_file:
+            pgn_file.close()
+
+    played = wins + draws + losses
+    if played:
+        score, _, elo, elo_low, elo_high = elo_estimate(wins, draws, losses)
+        print(f"\n{configs[0]['name']} vs {configs[1]['name']}: {wins} wins, {losses} losses, {draws} draws in {played} games "
+              f"({time.time() - start_time:.0f} s)")
+        error_bar = (elo_high - elo_low) / 2 if math.isfinite(elo_high - elo_low) else math.inf  #Infinite with a 0% or 100% score
+        print(f"Score {100 * score:.1f}%, Elo difference {elo:+.1f} (95% interval {elo_low:+.1f} to {elo_high:+.1f}, "
+              f"error bar ±{error_bar:.1f})")
+        print("Terminations: " + ", ".join(f"{name} {count}" for name, count in sorted(terminations.items())))
+    return wins, draws, losses
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Self-play match between two configurations of the engine")
+    parser.add_argument('--a', nargs='*', default=[], metavar='KEY=VALUE', help="settings of the first configuration")
+    parser.add_argument('--b', nargs='*', default=[], metavar='KEY=VALUE', help="settings of the second configuration")
+    parser.add_argument('--games', type=int, default=100, help="number of games (rounded up to an even number)")
+    parser.add_argument('--depth', type=int, help="default maximum depth of both configurations")
+    parser.add_argument('--movetime', type=float, help="default time per move of both configurations, in seconds")
+    parser.add_argument('--tc', help="default game clock of both configurations: seconds+increment")
+    parser.add_argument('--openings', nargs='*', help="opening suite: PGN files or files of FEN/EPD lines (default: the PGN files of the opening book)")
+    parser.add_argument('--opening-plies', type=int, default=OPENING_PLIES, help="half-moves played from each game of a PGN opening file")
+    parser.add_argument('--pgn', default='match.pgn', help="PGN file of the games")
+    parser.add_argument('--concurrency', type=int, default=cpu_count(), help="number of games played at the same time")
+    parser.add_argument('--sprt', nargs=2, type=float, metavar=('ELO0', 'ELO1'), help="stop the match with a SPRT of H0: elo0 against H1: elo1")
+    parser.add_argument('--alpha', type=float, default=0.05, help="false positive rate of the SPRT")
+    parser.add_argument('--beta', type=float, default=0.05, help="false negative rate of the SPRT")
+    args = parser.parse_args()
+
+    defaults = [f"{key}={value}" for key, value in (('depth', args.depth), ('movetime', args.movetime), ('tc', args.tc)) if value is not None]
+    try:
+        configs = [parse_config(defaults + args.a, 'A'), parse_config(defaults + args.b, 'B')]
+    except (ValueError, OSError) as error:
+        parser.error(str(error))
+    if configs[0]['name'] == configs[1]['name']:
+        parser.error("the two configurations need different names")
+
+    games = args.games + args.games % 2
+    opening_paths = args.openings or [os.path.join(PGN_FOLDER_PATH, name) for name in PGN_FILE_NAMES if os.path.exists(os.path.join(PGN_FOLDER_PATH, name))]
+    openings = load_openings(opening_paths, games // 2, args.opening_plies)
+    for config in configs:
+        print(f"{config['name']}: {time_control(config)}"
+              + (f", {len(config['params'])} parameters changed" if config['params'] else "")
+              + "".join(f", {key}={value}" for key, value in config['options'].items()))
+    print(f"{games} games from {len(set(openings))} openings on {args.concurrency} processes, PGN written to {args.pgn}")
+    run_match(configs, openings, games, args.concurrency, args.pgn, args.sprt, args.alpha, args.beta)
@@ -0,0 +1,118 @@
+#Build the opening book from the grandmaster games and save it to learned_opening_book.bin.
+#The book is built once with this script (python opening_book.py), and only rebuilt when the PGN files change (--force to rebuild anyway).
+#The engines load it at startup: the file uses the Polyglot format (16-byte records sorted by the Zobrist key of the position),
+#which python-chess memory-maps and searches by dichotomy, so no PGN is parsed when the game starts.
+import chess
+import chess.pgn
+import chess.polyglot
+from collections import defaultdict
+import hashlib
+import json
+import os
+import struct
+import sys
+
+#List of specific PGN file names to process : 29041 games
+PGN_FILE_NAMES = [
+    "VachierLagrave.pgn",
+    "Ding.pgn",
+    "Karpov.pgn",
+    "Kasparov.pgn",
+    "Carlsen.pgn",
+    "Caruana.pgn",
+    "Firouzja.pgn"
+]
+
+#The paths are relative to the folder of this file, so the book is found whatever the working directory (e.g. uci.py started by a GUI)
+PROJECT_PATH = os.path.dirname(os.path.abspath(__file__))
+PGN_FOLDER_PATH = os.path.join(PROJECT_PATH, 'PGN')
+
+OPENING_BOOK_FILE = os.path.join(PROJECT_PATH, 'learned_opening_book.bin')
+OPENING_BOOK_SOURCES_FILE = os.path.join(PROJECT_PATH, 'learned_opening_book.sources.json')  #Description of the PGN files the book was built from
+MAX_WEIGHT = 0xFFFF  #The weight of a Polyglot record is stored on 16 bits
+
+# -- Function to build the opening book: number of times each move was played in each position --
+def build_opening_book(PGN_FILE_NAMES, max_depth=10):
+    opening_book = defaultdict(lambda: defaultdict(int))
+    total_games = 0
+
+    for pgn_file_name in PGN_FILE_NAMES:
+        pgn_path = os.path.join(PGN_FOLDER_PATH, pgn_file_name)
+        if not os.path.exists(pgn_path):
+            print(f"{pgn_file_name} not found, skipped.")
+            continue
+        with open(pgn_path, 'r', encoding='latin-1', errors='ignore') as pgn_file:
+            while True:
+                game = chess.pgn.read_game(pgn_file)
+                if game is None:
+                    break
+
+                total_games += 1
+                board = game.board()
+
+                for move in game.mainline_moves():
+                    if board.fullmove_number > max_depth:
+                        break
+                    opening_book[chess.polyglot.zobrist_hash(board)][encode_move(board, move)] += 1
+                    board.push(move)
+
+    print(f"Total games in opening book: {total_games}")
+    return opening_book
+
+# -- Function that encodes a move as a Polyglot move (castling is written as the king capturing its rook) --
+def encode_move(board, move):
+    to_square = move.to_square
+    if board.is_castling(move):
+        rank = chess.square_rank(move.from_square)
+        to_square = chess.square(7 if board.is_kingside_castling(move) else 0, rank)
+    promotion = move.promotion - 1 if move.promotion else 0
+    return to_square | (move.from_square << 6) | (promotion << 12)
+
+# -- Function to save the opening book as Polyglot records sorted by key --
+def save_opening_book(opening_book, path=OPENING_BOOK_FILE):
+    with open(path, 'wb') as book_file:
+        for key in sorted(opening_book):
+            moves = opening_book[key]
+            #Scale the counts down if the most played move does not fit on 16 bits
+            scale = max(1, -(-max(moves.values()) // MAX_WEIGHT))
+            for raw_move, count in sorted(moves.items(), key=lambda item: -item[1]):
+                book_file.write(struct.pack('>QHHI', key, raw_move, max(1, count // scale), 0))
+
+# -- Function that describes the PGN files (name, size and SHA-1 of the content), to know if the book is up to date --
+#The modification time is not used: git and copies do not keep it, so the book would look outdated in every clone.
+def pgn_sources(PGN_FILE_NAMES):
+    sources = []
+    for pgn_file_name in PGN_FILE_NAMES:
+        pgn_path = os.path.join(PGN_FOLDER_PATH, pgn_file_name)
+        if os.path.exists(pgn_path):
+            sha1 = hashlib.sha1()
+            with open(pgn_path, 'rb') as pgn_file:
+                for chunk in iter(lambda: pgn_file.read(1 << 20), b''):
+                    sha1.update(chunk)
+            sources.append([pgn_file_name, os.path.getsize(pgn_path), sha1.hexdigest()])
+    return sources
+
+def is_opening_book_up_to_date(path=OPENING_BOOK_FILE, sources_path=OPENING_BOOK_SOURCES_FILE):
+    if not os.path.exists(path) or not os.path.exists(sources_path):
+        return False
+    with open(sources_path, 'r') as json_file:
+        return json.load(json_file) == pgn_sources(PGN_FILE_NAMES)
+
+# -- Function to load the opening book at startup (returns None if it has not been built) --
+def load_opening_book(path=OPENING_BOOK_FILE):
+    if not os.path.exists(path):
+        print("No opening book found. Build it with: python opening_book.py")
+        return None
+    if not is_opening_book_up_to_date(path):
+        print("The PGN files have changed since the opening book was built. Rebuild it with: python opening_book.py")
+    return chess.polyglot.open_reader(path)
+
+if __name__ == '__main__':
+    if '--force' not in sys.argv and is_opening_book_up_to_date():
+        print(f"{OPENING_BOOK_FILE} is up to date.")
+    else:
+        opening_book = build_opening_book(PGN_FILE_NAMES)
+        save_opening_book(opening_book)
+        with open(OPENING_BOOK_SOURCES_FILE, 'w') as json_file:
+            json.dump(pgn_sources(PGN_FILE_NAMES), json_file)
+        print(f"Opening book saved to {OPENING_BOOK_FILE} ({len(opening_book)} positions)")
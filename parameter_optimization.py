@@ -1,20 +1,31 @@
 import json  #Loading the library to handle JSON files
 import numpy as np  #Loading the library for numerical computations
-from scipy.optimize import minimize  #Loading the gradient descent algorithm (BFGS)
+from scipy.optimize import minimize, minimize_scalar  #Loading the gradient descent algorithm (BFGS)
+from scipy.special import expit  #Sigmoid function (no overflow for the scores of checkmates)
 import chess  #Loading the python-chess library to manipulate chess positions
 from tqdm import tqdm #Progress bar to track progresst
-import random
 from multiprocessing import Pool, cpu_count
 import time
-
-#Load grandmaster move data
-with open('master_moves_data.json', 'r') as json_file:
-    master_moves_data = json.load(json_file)  #Loading move and position data
-print(f"Number of master_moves_data: {len(master_moves_data)}")
-
-#Randomly select 0.1% of the moves (we have trained with other proportions of the dataset too)
-sampled_moves_data = random.sample(master_moves_data, len(master_moves_data) // 1000)
-print(f"Number of sampled_moves_data: {len(sampled_moves_data)}")
+import os
+import sys
+
+from training_data import TRAINING_DATA_FILE, load_training_data, sample_indices, decode_position, game_results
+from bitboard_evaluation import PIECE_VALUE_NAMES, BB_CENTER, BB_KING_SAFETY, BB_OUTPOSTS, pawn_structure
+
+CHUNKS_PER_PROCESS = 4 #Number of tasks per process at each call of the cost function (balances the load between the processes)
+#'vectorized': move-match loss (the evaluation should prefer the moves of the masters) on a 0.1% sample, computed from the cached
+#features of the positions after each legal move
+#'workers': same loss as 'vectorized', computed with evaluate_board on a pool of processes
+#'texel': logistic loss on the results of the games with an analytic gradient, over all the positions (optimizes another goal:
+#predicting the result of the game rather than matching the moves of the masters)
+TUNING_MODE = 'vectorized'
+BATCH_SIZE = 16384 #Number of positions of a mini-batch of the texel mode (None: L-BFGS on all the positions at each iteration)
+EPOCHS = 10 #Number of passes over all the positions in mini-batch mode
+LEARNING_RATE = 0.01 #Step size of the Adam optimizer in mini-batch mode
+FEATURES_FILE = 'master_features.npy' #Feature matrix of all the positions of master_moves_data.bin (built with: python parameter_optimization.py features)
+FEATURES_SOURCES_FILE = 'master_features.sources.json' #Description of the training data and of the features FEATURES_FILE was built from
+FEATURES_CHUNK_SIZE = 1000 #Number of positions of a feature extraction task
+CHILD_FEATURES_CHUNK_SIZE = 50 #Number of positions of a child feature extraction task (about 35 legal moves per position)
 
 #Initialize evaluation function parameters (this parameters are trained parameters from last optimization)
 params = {
@@ -338,38 +349,340 @@ def evaluate_king_proximity_endgame(board, params):
 
     return score
 
+#Every term of evaluate_board is a parameter multiplied by a quantity that only depends on the position (number of pawns, of isolated pawns, of open files...).
+#These quantities are the features of the position: evaluate_board(board, params) = features . (params values, 1).
+#The last feature is the constant part of the score (the score of a checkmate, which does not depend on the parameters).
+#The features are extracted once, then the evaluation of the whole sample for any parameter vector is a single matrix-vector product.
+
+#Piece-square tables by piece type and square (tables are oriented for White, flipped for Black)
+PIECE_SQUARE_TABLES = {chess.KNIGHT: knightScores, chess.BISHOP: bishopScores, chess.QUEEN: queenScores, chess.ROOK: rookScores}
+PST_WHITE = {piece_type: [table[chess.square_rank(sq)][chess.square_file(sq)] for sq in chess.SQUARES] for piece_type, table in PIECE_SQUARE_TABLES.items()}
+PST_BLACK = {piece_type: [table[7 - chess.square_rank(sq)][chess.square_file(sq)] for sq in chess.SQUARES] for piece_type, table in PIECE_SQUARE_TABLES.items()}
+PST_WHITE[chess.PAWN] = [whitePawnScores[chess.square_rank(sq)][chess.square_file(sq)] for sq in chess.SQUARES]
+PST_BLACK[chess.PAWN] = [blackPawnScores[7 - chess.square_rank(sq)][chess.square_file(sq)] for sq in chess.SQUARES]
+
+NUM_FEATURES = len(params) + 1
+
+# -- Function that extracts the features of a position (same order as params, then the constant) --
+def extract_features(board):
+    features = dict.fromkeys(params, 0)
+    if board.is_checkmate():
+        return [0] * len(params) + [10000 if board.turn == chess.BLACK else -10000]
+
+    white = board.occupied_co[chess.WHITE]
+    black = board.occupied_co[chess.BLACK]
+    for piece_type, name in PIECE_VALUE_NAMES.items():
+        pieces = board.pieces_mask(piece_type, chess.WHITE) | board.pieces_mask(piece_type, chess.BLACK)
+        features[name] = chess.popcount(pieces & white) - chess.popcount(pieces & black)
+
+    #evaluate_pawn_structure counts the doubled pawns once per file, hence the factor 8
+    doubled, isolated, passed = pawn_structure(board.pawns & white, board.pawns & black)
+    features['double_pawn_penalty'] = 8 * doubled
+    features['isolated_pawn_penalty'] = -isolated
+    features['passed_pawn_bonus'] = passed
+
+    pst = 0
+    for piece_type in PST_WHITE:
+        for square in chess.scan_forward(board.pieces_mask(piece_type, chess.WHITE)):
+            pst += PST_WHITE[piece_type][square]
+        for square in chess.scan_forward(board.pieces_mask(piece_type, chess.BLACK)):
+            pst -= PST_BLACK[piece_type][square]
+    features['piece_square_table_weight'] = pst
+
+    features['center_control_bonus'] = chess.popcount(board.occupied & BB_CENTER)
+    features['king_safety_bonus'] = chess.popcount(board.kings & BB_KING_SAFETY)
+
+    legal_moves = list(board.legal_moves)
+    features['piece_mobility_bonus'] = len(legal_moves)
+    captures = sum(1 for move in legal_moves if board.occupied_co[not board.turn] & chess.BB_SQUARES[move.to_square])
+    features['attacked_piece_penalty'] = captures if board.turn == chess.WHITE else -captures
+
+    white_king = board.king(chess.WHITE)
+    black_king = board.king(chess.BLACK)
+    if board.fullmove_number > 40:
+        features['king_activity_endgame'] = (7 - chess.square_rank(white_king) if white_king is not None else 0) - (chess.square_rank(black_king) if black_king is not None else 0)
+    #Pawn advancement is counted positively for both colors (as in evaluate_advanced_endgame)
+    features['pawn_advancement_endgame'] = sum(chess.square_rank(sq) for sq in chess.scan_forward(board.pawns & white)) + sum(7 - chess.square_rank(sq) for sq in chess.scan_forward(board.pawns & black))
+
+    #Bishop pair: the sign is given by the color of the bishop on the highest square (first bishop of board.piece_map())
+    if chess.popcount(board.bishops) >= 2:
+        features['bishop_pair_bonus'] = 1 if white & chess.BB_SQUARES[chess.msb(board.bishops)] else -1
+    features['knight_outpost_bonus'] = chess.popcount(board.knights & white & BB_OUTPOSTS) - chess.popcount(board.knights & black & BB_OUTPOSTS)
+
+    #Every rook gets the bonus of every open and semi-open file (as in evaluate_rook_open_file)
+    rook_balance = chess.popcount(board.rooks & white) - chess.popcount(board.rooks & black)
+    pieces_on_files = [chess.popcount(board.occupied & file_mask) for file_mask in chess.BB_FILES]
+    features['rook_open_file_bonus'] = rook_balance * pieces_on_files.count(0)
+    features['rook_semi_open_file_bonus'] = rook_balance * pieces_on_files.count(1)
+
+    features['king_proximity_to_center_endgame'] = (1 if white_king is not None and BB_CENTER & chess.BB_SQUARES[white_king] else 0) - (1 if black_king is not None and BB_CENTER & chess.BB_SQUARES[black_king] else 0)
+
+    return list(features.values()) + [0]
+
+# -- Worker function: extracts the features of the positions of master_moves_data.bin with the given indices --
+def extract_features_worker(indices):
+    training_data = load_training_data()
+    return np.array([extract_features(decode_position(record)[0]) for record in training_data[indices]], dtype=np.float32)
+
+# -- Function that extracts the features of the given positions in parallel, in the order of the indices --
+def extract_feature_matrix(indices, pool):
+    chunks = [indices[i:i + FEATURES_CHUNK_SIZE] for i in range(0, len(indices), FEATURES_CHUNK_SIZE)]
+    features = np.empty((len(indices), NUM_FEATURES), dtype=np.float32)
+    row = 0
+    for chunk_features in tqdm(pool.imap(extract_features_worker, chunks), total=len(chunks)):
+        features[row:row + len(chunk_features)] = chunk_features
+        row += len(chunk_features)
+    return features
+
+# -- Function that saves the feature matrix of all the positions of master_moves_data.bin --
+def build_features_file(training_data, pool, path=FEATURES_FILE):
+    features = np.lib.format.open_memmap(path, mode='w+', dtype=np.float32, shape=(len(training_data), NUM_FEATURES))
+    for start in range(0, len(training_data), FEATURES_CHUNK_SIZE * 100):
+        indices = np.arange(start, min(start + FEATURES_CHUNK_SIZE * 100, len(training_data)))
+        features[indices] = extract_feature_matrix(indices, pool)
+    features.flush()
+    with open(FEATURES_SOURCES_FILE, 'w') as json_file:
+        json.dump(features_sources(), json_file)
+
+# -- Function that describes the training data (size and modification time) and the number of features, to know if FEATURES_FILE is up to date --
+def features_sources():
+    stat = os.stat(TRAINING_DATA_FILE)
+    return {'training_data': [TRAINING_DATA_FILE, stat.st_size, int(stat.st_mtime)], 'num_features': NUM_FEATURES}
+
+def is_features_file_up_to_date(training_data, path=FEATURES_FILE, sources_path=FEATURES_SOURCES_FILE):
+    if not os.path.exists(path) or not os.path.exists(sources_path):
+        return False
+    features = np.load(path, mmap_mode='r')
+    if features.shape != (len(training_data), NUM_FEATURES):
+        return False
+    with open(sources_path, 'r') as json_file:
+        return json.load(json_file) == features_sources()
+
+#The move-match loss compares, for each position, the best move according to the evaluation with the move played by the master.
+#The features of the position reached by each legal move are extracted once, multiplied by the sign of the side to move
+#(the evaluation is from White's point of view), and kept for the whole optimization: the scores of all the moves of
+#the sample are then a single product of this matrix with the parameter vector.
+
+# -- Function that extracts the features of the positions after each legal move, from the point of view of the side to move --
+#Returns the rows and the index of the move of the master among them (None if it is not a legal move).
+def extract_child_features(board, master_move):
+    sign = 1 if board.turn == chess.WHITE else -1
+    rows = []
+    master_index = None
+    for move in board.legal_moves:
+        if move == master_move:
+            master_index = len(rows)
+        board.push(move)
+        rows.append([sign * feature for feature in extract_features(board)])
+        board.pop()
+    return rows, master_index
+
+# -- Worker function: extracts the child features of the positions of master_moves_data.bin with the given indices --
+#Returns the rows of all the positions, the number of legal moves of each position and the index of the master move in its rows.
+def extract_child_features_worker(indices):
+    training_data = load_training_data()
+    features = []
+    move_counts = []
+    master_indices = []
+    for record in training_data[indices]:
+        board, move = decode_position(record)
+        rows, master_index = extract_child_features(board, move)
+        if master_index is None:
+            continue
+        features.extend(rows)
+        move_counts.append(len(rows))
+        master_indices.append(master_index)
+    return np.array(features, dtype=np.float32).reshape(-1, NUM_FEATURES), move_counts, master_indices
+
+# -- Function that extracts the child features of the given positions in parallel --
+#Returns the matrix of the rows of all the moves, the first row of each position and the row of each master move.
+def extract_child_feature_matrix(indices, pool):
+    chunks = [indices[i:i + CHILD_FEATURES_CHUNK_SIZE] for i in range(0, len(indices), CHILD_FEATURES_CHUNK_SIZE)]
+    features = []
+    move_counts = []
+    master_indices = []
+    for chunk_features, chunk_move_counts, chunk_master_indices in tqdm(pool.imap(extract_child_features_worker, chunks), total=len(chunks)):
+        features.append(chunk_features)
+        move_counts.extend(chunk_move_counts)
+        master_indices.extend(chunk_master_indices)
+    starts = np.concatenate(([0], np.cumsum(move_counts)[:-1])).astype(np.int64)
+    return np.concatenate(features), starts, starts + np.array(master_indices, dtype=np.int64)
+
+# -- Function that evaluates all the positions of a feature matrix for a parameter vector --
+def evaluate_features(features, x):
+    return features @ np.append(np.asarray(x, dtype=np.float64), 1.0)
+
 # -- Cost function --
+#Each legal move is played and the position reached is evaluated once, from the point of view of the side to move.
+#The move of the master is given in UCI notation, so it is compared with the legal moves without parsing SAN.
 def evaluate_position_worker(data_and_params):
     data, temp_params = data_and_params
     board = chess.Board(data['fen'])
-    best_move = data['move']
+    best_move = chess.Move.from_uci(data['move'])
+    sign = 1 if board.turn == chess.WHITE else -1
 
-    legal_moves = list(board.legal_moves)
-    move_scores = {move: evaluate_board(board, temp_params) for move in legal_moves}
+    move_scores = {}
+    for move in board.legal_moves:
+        board.push(move)
+        move_scores[move] = sign * evaluate_board(board, temp_params)
+        board.pop()
 
-    best_move_score = move_scores.get(best_move, 0)
+    if best_move not in move_scores:
+        return 0
+    best_move_score = move_scores[best_move]
     max_score = max(move_scores.values())
 
     return (max_score - best_move_score) ** 2
 
-def cost_function(x):
+#The pool of processes lives for the whole optimization: each worker receives the sampled positions once (init_worker),
+#then each call of the cost function only sends the parameter vector and the range of positions of each task,
+#and each task returns the sum of the errors of its positions.
+worker_moves_data = None  #Sampled positions, set in each worker by init_worker
+
+def init_worker(moves_data):
+    global worker_moves_data
+    worker_moves_data = moves_data
+
+def evaluate_chunk_worker(chunk):
+    start, end, x = chunk
     temp_params = {key: x[i] for i, key in enumerate(params.keys())}
-    task_data = [(data, temp_params) for data in sampled_moves_data]
+    return sum(evaluate_position_worker((data, temp_params)) for data in worker_moves_data[start:end])
 
-    with Pool(cpu_count()) as pool:
-        errors = list(pool.imap(evaluate_position_worker, task_data))
+def cost_function(x, pool, num_positions, num_chunks):
+    temp_params = {key: x[i] for i, key in enumerate(params.keys())}
+    bounds = [num_positions * i // num_chunks for i in range(num_chunks + 1)]
+    x = list(x)
+    tasks = [(bounds[i], bounds[i + 1], x) for i in range(num_chunks)]
 
-    total_error = sum(errors)
+    total_error = sum(pool.map(evaluate_chunk_worker, tasks))
     print(f"Total error: {total_error} with parameters: {temp_params}")
     return total_error
 
+#Same error as cost_function, computed from the child features, with its gradient:
+#for each position, d error / d x = 2 * (max score - master score) * (features of the best move - features of the master move).
+def cost_function_vectorized(x, child_features, starts, master_rows):
+    scores = evaluate_features(child_features, x)
+    max_scores = np.maximum.reduceat(scores, starts)
+
+    #Row of the best move of each position (the first one in case of equality)
+    move_counts = np.diff(np.append(starts, len(scores)))
+    best_rows = np.flatnonzero(scores == np.repeat(max_scores, move_counts))
+    _, first_best = np.unique(np.searchsorted(starts, best_rows, side='right'), return_index=True)
+    best_rows = best_rows[first_best]
+
+    errors = max_scores - scores[master_rows]
+    total_error = float(np.sum(errors ** 2))
+    gradient = 2 * (child_features[best_rows, :-1] - child_features[master_rows, :-1]).T.astype(np.float64) @ errors
+
+    temp_params = {key: x[i] for i, key in enumerate(params.keys())}
+    print(f"Total error: {total_error} with parameters: {temp_params}")
+    return total_error, gradient
+
+#Texel tuning: the evaluation (in pawns, from White's point of view) is turned into the expected score of White by a sigmoid,
+#1 / (1 + 10^(-k * evaluation / 4)), and the loss is the mean squared difference with the result of the game of each position.
+#Since the evaluation is linear in the parameters, the gradient of the loss is a product of the transposed feature matrix
+#with a vector of weights, so each iteration costs two matrix-vector products over the positions instead of a numerical gradient.
+
+# -- Function that returns the expected score of White for the evaluations --
+def expected_score(evaluations, k):
+    return expit(k * np.log(10) / 4 * evaluations)
+
+# -- Function that returns the loss of the texel mode --
+def texel_loss(x, features, results, k):
+    return float(np.mean((results - expected_score(evaluate_features(features, x), k)) ** 2))
+
+# -- Function that returns the loss of the texel mode and its gradient with respect to the parameters --
+def texel_loss_and_gradient(x, features, results, k):
+    scores = expected_score(evaluate_features(features, x), k)
+    errors = results - scores
+    #d loss / d x = mean(-2 * error * sigmoid'(evaluation) * features), with sigmoid' = c * score * (1 - score)
+    weights = -2 * errors * scores * (1 - scores) * (k * np.log(10) / 4)
+    gradient = features[:, :-1].T @ weights / len(results)
+    return float(np.mean(errors ** 2)), gradient
+
+# -- Function that finds the scaling constant k which best fits the results with the current parameters --
+def fit_scaling_constant(x, features, results):
+    return minimize_scalar(lambda k: texel_loss(x, features, results, k), bounds=(0.01, 10), method='bounded').x
+
+# -- Function that minimizes the loss of the texel mode with the Adam optimizer on shuffled mini-batches --
+def tune_minibatch(x, features, results, k, epochs=EPOCHS, batch_size=BATCH_SIZE, learning_rate=LEARNING_RATE, seed=None):
+    rng = np.random.default_rng(seed)
+    x = np.array(x, dtype=np.float64)
+    m = np.zeros_like(x)  #Moving averages of the gradient and of its square
+    v = np.zeros_like(x)
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    step = 0
+    for epoch in range(epochs):
+        order = rng.permutation(len(results))
+        for start in range(0, len(order), batch_size):
+            batch = np.sort(order[start:start + batch_size])
+            _, gradient = texel_loss_and_gradient(x, features[batch], results[batch], k)
+            step += 1
+            m = beta1 * m + (1 - beta1) * gradient
+            v = beta2 * v + (1 - beta2) * gradient ** 2
+            x -= learning_rate * (m / (1 - beta1 ** step)) / (np.sqrt(v / (1 - beta2 ** step)) + epsilon)
+        print(f"Epoch {epoch + 1}/{epochs}: loss {texel_loss(x, features, results, k)}")
+    return x
+
+# -- Function that loads the features and the results of all the positions of known result --
+def load_texel_data(training_data, pool, path=FEATURES_FILE):
+    if not is_features_file_up_to_date(training_data, path):
+        print(f"Extracting the features of all the positions to {path} (missing, or built from other data or features)...")
+        build_features_file(training_data, pool, path)
+    results = game_results(training_data)
+    known = ~np.isnan(results)
+    features = np.load(path)
+    return features[known], results[known]
+
 if __name__ == '__main__':
-    initial_values = list(params.values())
+    #Load grandmaster move data (memory-mapped: only the sampled positions are read from the disk)
+    master_moves_data = load_training_data()  #Loading move and position data
+    print(f"Number of master_moves_data: {len(master_moves_data)}")
 
-    print("Optimization in progress...")
-    result = minimize(cost_function, initial_values, method='BFGS', options={'maxiter': 5})
+    if len(sys.argv) > 1 and sys.argv[1] == 'features':
+        #Extract the features of all the positions once
+        with Pool(cpu_count()) as pool:
+            build_features_file(master_moves_data, pool)
+        print(f"Features saved in {FEATURES_FILE}")
+        sys.exit()
 
-    optimized_params = {key: result.x[i] for i, key in enumerate(params.keys())}
+    initial_values = list(params.values())
+    processes = cpu_count()
+
+    if TUNING_MODE == 'texel':
+        with Pool(processes) as pool:
+            features, results = load_texel_data(master_moves_data, pool)
+        print(f"Number of positions with a known result: {len(results)}")
+        k = fit_scaling_constant(initial_values, features, results)
+        print(f"Scaling constant: {k}, initial loss: {texel_loss(initial_values, features, results, k)}")
+
+        print("Optimization in progress...")
+        start_time = time.time()
+        if BATCH_SIZE is None:
+            result = minimize(texel_loss_and_gradient, initial_values, args=(features, results, k), jac=True, method='L-BFGS-B')
+            optimized_values = result.x
+        else:
+            optimized_values = tune_minibatch(initial_values, features, results, k)
+        print(f"Final loss: {texel_loss(optimized_values, features, results, k)} ({time.time() - start_time:.1f} s)")
+    else:
+        #Randomly select 0.1% of the moves (we have trained with other proportions of the dataset too)
+        indices = sample_indices(master_moves_data, len(master_moves_data) // 1000)
+        print(f"Number of sampled_moves_data: {len(indices)}")
+
+        if TUNING_MODE == 'vectorized':
+            with Pool(processes) as pool:
+                child_features, starts, master_rows = extract_child_feature_matrix(indices, pool)
+            print("Optimization in progress...")
+            result = minimize(cost_function_vectorized, initial_values, args=(child_features, starts, master_rows), jac=True, method='BFGS', options={'maxiter': 5})
+        else:
+            sampled_moves_data = [{'fen': board.fen(), 'move': move.uci()} for board, move in (decode_position(record) for record in master_moves_data[indices])]
+            print("Optimization in progress...")
+            num_chunks = max(1, min(len(sampled_moves_data), processes * CHUNKS_PER_PROCESS))
+            with Pool(processes, initializer=init_worker, initargs=(sampled_moves_data,)) as pool:
+                result = minimize(cost_function, initial_values, args=(pool, len(sampled_moves_data), num_chunks), method='BFGS', options={'maxiter': 5})
+        optimized_values = result.x
+
+    optimized_params = {key: optimized_values[i] for i, key in enumerate(params.keys())}
     with open('trained_parameters.json', 'w') as json_file:
         json.dump(optimized_params, json_file, indent=4)
 
@@ -2,85 +2,58 @@
 import chess
 import chess.engine
 import chess.pgn
-from collections import defaultdict
 import pygame   
-import os
-from functools import lru_cache
 import json
-
-#List of specific PGN file names to process : 29041 games
-PGN_FILE_NAMES = [
-    "VachierLagrave.pgn",
-    "Ding.pgn",
-    "Karpov.pgn",
-    "Kasparov.pgn",
-    "Carlsen.pgn",
-    "Caruana.pgn",
-    "Firouzja.pgn"
-]
-
-#Path to the PGN folder within the current working directory
-PGN_FOLDER_PATH = os.path.join(os.getcwd(), 'PGN')
-
-# -- Function to build the opening book --
-def build_opening_book(PGN_FILE_NAMES, max_depth=10):
-    opening_book = defaultdict(lambda: defaultdict(int))
-    total_games = 0
-
-    for pgn_file_name in PGN_FILE_NAMES:
-        pgn_path = os.path.join(PGN_FOLDER_PATH, pgn_file_name)
-        with open(pgn_path, 'r', encoding='latin-1', errors='ignore') as pgn_file:
-            while True:
-                game = chess.pgn.read_game(pgn_file)
-                if game is None:
-                    break
-
-                total_games += 1
-                board = game.board()
-
-                for move in game.mainline_moves():
-                    if board.fullmove_number > max_depth:
-                        break
-                    san_move = board.san(move)
-                    fen = board.board_fen()
-                    opening_book[fen][san_move] += 1
-                    board.push(move)
-
-    print(f"Total games in opening book: {total_games}")
-    return opening_book
-
-#Build the opening book
-opening_book = build_opening_book(PGN_FILE_NAMES)
-
-#Save the opening book
-with open('learned_opening_book.json', 'w') as json_file:
-    json.dump(opening_book, json_file, indent=4)
-
-print("Opening book saved to learned_opening_book.json")
+import time
+import math
+import numpy as np
+from multiprocessing import Pool, RawValue
+from transposition_table import TranspositionTable, zobrist_key, EXACT, LOWERBOUND, UPPERBOUND
+from incremental_evaluation import IncrementalEvaluator
+from bitboard_evaluation import evaluate_board_bitboard, PIECE_VALUE_NAMES
+from opening_book import load_opening_book, OPENING_BOOK_FILE
+
+#Load the opening book built by opening_book.py (Polyglot file, memory-mapped: nothing is parsed at startup)
+opening_book = load_opening_book(OPENING_BOOK_FILE)
 
 # -- Function to get an opening move --
 def get_opening_move(board):
-    fen = board.board_fen()
-    if fen in opening_book:
+    if opening_book is None:
+        return None
+    #Most played move of the position (the book only contains legal moves for the position)
+    entry = opening_book.get(board)
+    if entry is not None:
         print("Opening move detected. Using book move.")
-        possible_moves = opening_book[fen]
-        best_move = max(possible_moves, key=possible_moves.get)
-        
-        try:
-            #Directly play using SAN
-            move = board.parse_san(best_move)  #Use SAN directly
-            if move in board.legal_moves:
-                return move
-            else:
-                print(f"Move {best_move} from book is illegal in this position.")
-        except Exception as e:
-            print(f"Error parsing SAN move from book: {e}")
+        return entry.move
     
     return None
 
 CHECKMATE = 1000
 DRAW = 0
-DEPTH = 4 #Number of half-moves
+DEPTH = 4 #Number of half-moves searched when there is no time limit
+TIME_LIMIT = 5.0 #Time budget in seconds for each AI move (None: fixed search at DEPTH)
+MAX_DEPTH = 32 #Maximum depth reached by iterative deepening within the time budget
+MOVES_TO_GO = 30 #Number of moves the remaining clock time is shared between when no move count is given
+TT_SIZE_MB = 64 #Memory budget of the transposition table (of each process of the search)
+SEARCH_PROCESSES = 1 #Number of processes of the search (1: single process, more: the root moves are split across a pool of processes)
+EVALUATOR = 'incremental' #Evaluation used by the search: 'standard' (evaluate_board with a cache), 'bitboard' or 'incremental' (updated on push/pop)
+VERIFY_EVALUATOR = False #Check every evaluation of the selected evaluator against evaluate_board (slow, for debugging)
+QUIESCENCE = True #Search the captures at the horizon of the search instead of stopping on a static evaluation
+QUIESCENCE_CHECK_EVASIONS = False #In the quiescence search, also search every evasion when the side to move is in check
+DELTA_MARGIN = 2.0 #Delta pruning: captures that cannot raise alpha even with this margin (in pawns) are skipped
+MAX_PLY = 64 #Maximum distance from the root for the killer moves
+PVS = True #Principal variation search: the moves after the first one are searched with a null window, and searched again only if they are better
+NULL_WINDOW = 1e-6 #Width of the null window (in pawns)
+ASPIRATION_WINDOW = 0.5 #Half-width of the root window around the score of the previous iteration, in pawns (None: always a full window)
+ASPIRATION_MIN_DEPTH = 3 #Iterations below this depth use a full window
+NULL_MOVE_PRUNING = True #Skip the search of a node when passing the turn already gives a score above beta
+NULL_MOVE_MIN_DEPTH = 3 #Minimum remaining depth for null-move pruning
+NULL_MOVE_REDUCTION = 2 #Depth reduction of the search after the null move
+LATE_MOVE_REDUCTIONS = True #Search the quiet moves ordered late at a reduced depth, and at full depth only if they turn out better than alpha
+LMR_MIN_DEPTH = 3 #Minimum remaining depth for late-move reductions
+LMR_MIN_MOVES = 3 #Number of moves of a node searched at full depth before reducing
+LMR_BASE = 0.75 #Reduction of the late moves: LMR_BASE + log(depth) * log(move number) / LMR_DIVISOR plies
+LMR_DIVISOR = 2.25
 
 params = {
     'pawn_value': 0.6913448662622311,  #Pawn value
@@ -102,8 +75,11 @@ params = {
     'king_proximity_to_center_endgame': 0.3275250912748785  #Bonus for a king near the center in the endgame
 }
 
+#The search time of an AI move can be given directly (time_limit, in seconds) or derived from a game clock with allocate_time.
+#Without arguments, TIME_LIMIT is used (or a fixed search at DEPTH if TIME_LIMIT is None).
+#info_callback is called with the search information (see search_info) after each completed iteration (None: no report).
 class AI():
-    def AI_move(board):
+    def AI_move(board, time_limit=None, max_depth=None, info_callback=None):
         global nextMove
         nextMove = None
         #Check for mate in one
@@ -118,7 +94,17 @@ class AI():
         
         if nextMove is None:
             print("Not an opening position. Using NegaMax.")
-            nextMove = findMoveNegaMaxAlphaBeta(board, DEPTH, -1000, 1000, 1 if board.turn == chess.WHITE else -1)
+            if time_limit is None and max_depth is None:
+                time_limit = TIME_LIMIT
+                max_depth = DEPTH if TIME_LIMIT is None else MAX_DEPTH
+            elif max_depth is None:
+                max_depth = MAX_DEPTH
+            if info_callback is None:
+                info_callback = print_search_info
+            if SEARCH_PROCESSES > 1:
+                nextMove = findMoveParallel(board, max_depth, time_limit, info_callback)
+            else:
+                nextMove = findMoveIterativeDeepening(board, max_depth, time_limit, info_callback)
         
         #Convert the move to SAN notation for display
         if nextMove and nextMove in board.legal_moves:
@@ -133,22 +119,483 @@ class AI():
 #Beta: the best value that the minimizing player (Black) can guarantee.
 #Thanks to move ordering, the best moves (strong captures) are tested first. This maximizes the chances of triggering Alpha-Beta pruning, as good moves quickly increase alpha or reduce beta.
 
-# -- Optimized NegaMax function with Move Ordering (MVV-LVA) --
-def findMoveNegaMaxAlphaBeta(board, depth, alpha, beta, turnColor):
-    global nextMove
-    if depth == 0:
-        return turnColor * evaluate_board_cached(board.fen())
+# -- Function to derive the time budget of a move from a game clock (time left and increment in seconds) --
+def allocate_time(time_left, increment=0, moves_to_go=None):
+    if moves_to_go is None or moves_to_go <= 0:
+        moves_to_go = MOVES_TO_GO
+    budget = time_left / moves_to_go + increment * 0.8
+    #Never use more than half of the remaining time, and keep a safety margin for the move transmission
+    return max(0.05, min(budget, time_left * 0.5) - 0.05)
+
+#Exception raised inside the search when the time budget is exhausted
+class SearchTimeout(Exception):
+    pass
+
+search_deadline = None  #Time at which the current search must stop (None: no limit)
+
+#The search can be stopped from another thread (e.g. the GUI) with stop_search: it then returns the best move of the last completed iteration.
+#The flag is in shared memory, so the processes of the parallel search see it too.
+stop_flag = RawValue('b', 0)
+search_nodes = 0  #Number of nodes (NegaMax and quiescence) visited by the current search
+
+#Counters of the current search, to tell whether a slow move comes from the move ordering, the cost of the evaluation or the size of the tree:
+#- seldepth: maximum distance from the root reached (quiescence included),
+#- tt_probes, tt_hits: lookups of the transposition table and positions found,
+#- cutoffs, first_move_cutoffs: beta cutoffs, and those caused by the first move searched (good ordering: above 90%),
+#- eval_cache_lookups, eval_cache_hits: lookups of the Zobrist-keyed evaluation cache (evaluator 'standard') and positions found,
+#- pawn_table_lookups, pawn_table_hits: lookups of the pawn structure table (evaluator 'incremental') and pawn structures found.
+search_stats = {'seldepth': 0, 'tt_probes': 0, 'tt_hits': 0, 'cutoffs': 0, 'first_move_cutoffs': 0, 'eval_cache_lookups': 0, 'eval_cache_hits': 0,
+                'pawn_table_lookups': 0, 'pawn_table_hits': 0}
+eval_cache_start = (0, 0, 0, 0)  #Counts of the evaluator caches at the start of the search
+
+#Result of the last completed iteration, given to the info callback: depth, seldepth, score (from White's point of view), principal variation
+#(pv in SAN, pv_uci in UCI), time, nodes, nodes per second and the hit rates of the counters (None when there was no lookup, e.g. the
+#evaluation cache when the evaluator is not 'standard')
+search_info = {'depth': 0, 'seldepth': 0, 'score': None, 'pv': [], 'pv_uci': [], 'time': 0.0, 'nodes': 0, 'nps': 0,
+               'tt_hit_rate': None, 'first_move_cutoff_ratio': None, 'eval_cache_hit_rate': None, 'pawn_table_hit_rate': None}
+
+# -- Function to stop the current search as soon as possible --
+def stop_search():
+    stop_flag.value = 1
+
+# -- Function that returns the number of hits and lookups (since the start of the program) of the evaluation cache and of the pawn table --
+def eval_cache_counts():
+    return eval_cache_hits, eval_cache_lookups, incremental_evaluator.pawn_table_hits, incremental_evaluator.pawn_table_lookups
+
+# -- Function that resets the node counter and the counters of the search --
+def reset_search_stats():
+    global search_nodes, eval_cache_start
+    search_nodes = 0
+    for name in search_stats:
+        search_stats[name] = 0
+    check_eval_cache_params()
+    eval_cache_start = eval_cache_counts()
+
+# -- Function that updates the counters of the evaluator caches since the start of the search --
+def update_eval_cache_stats():
+    names = ['eval_cache_hits', 'eval_cache_lookups', 'pawn_table_hits', 'pawn_table_lookups']
+    for name, count, start in zip(names, eval_cache_counts(), eval_cache_start):
+        search_stats[name] = count - start
+
+# -- Function that resets the stop flag, the counters and the search information at the start of a search --
+def start_search_info():
+    stop_flag.value = 0
+    reset_search_stats()
+    search_info.update(depth=0, seldepth=0, score=None, pv=[], pv_uci=[], time=0.0, nodes=0, nps=0,
+                       tt_hit_rate=None, first_move_cutoff_ratio=None, eval_cache_hit_rate=None, pawn_table_hit_rate=None)
+
+def ratio(count, total):
+    return count / total if total else None
+
+# -- Function that fills search_info at the end of an iteration and sends a copy to the info callback --
+def report_iteration(board, depth, score, pv_moves, elapsed, info_callback):
+    pv = []
+    pv_board = board.copy(stack=False)
+    for move in pv_moves:
+        pv.append(pv_board.san(move))
+        pv_board.push(move)
+    search_info.update(depth=depth, seldepth=max(depth, search_stats['seldepth']), score=score, pv=pv, pv_uci=[move.uci() for move in pv_moves],
+                       time=elapsed, nodes=search_nodes, nps=int(search_nodes / elapsed) if elapsed > 0 else 0,
+                       tt_hit_rate=ratio(search_stats['tt_hits'], search_stats['tt_probes']),
+                       first_move_cutoff_ratio=ratio(search_stats['first_move_cutoffs'], search_stats['cutoffs']),
+                       eval_cache_hit_rate=ratio(search_stats['eval_cache_hits'], search_stats['eval_cache_lookups']),
+                       pawn_table_hit_rate=ratio(search_stats['pawn_table_hits'], search_stats['pawn_table_lookups']))
+    if info_callback is not None:
+        info_callback(dict(search_info))
+
+# -- Function that formats a rate as a percentage ('-' when there was no lookup) --
+def format_rate(rate):
+    return '-' if rate is None else f"{100 * rate:.0f}%"
+
+# -- Function that describes the hit rates of the evaluator caches used by the search (empty when none was used) --
+def format_eval_cache_rates(info, eval_cache_label, pawn_table_label):
+    rates = []
+    if info['eval_cache_hit_rate'] is not None:
+        rates.append(f"{eval_cache_label} {format_rate(info['eval_cache_hit_rate'])}")
+    if info['pawn_table_hit_rate'] is not None:
+        rates.append(f"{pawn_table_label} {format_rate(info['pawn_table_hit_rate'])}")
+    return rates
+
+# -- Info callback of the command line: prints one line per iteration --
+def print_search_info(info):
+    statistics = [f"{info['nodes']} nodes", f"{info['nps']} nodes/s", f"TT hits {format_rate(info['tt_hit_rate'])}",
+                  f"first move cutoffs {format_rate(info['first_move_cutoff_ratio'])}"]
+    statistics += format_eval_cache_rates(info, "eval cache hits", "pawn table hits")
+    print(f"Depth {info['depth']}/{info['seldepth']}: score {info['score']:.2f}, PV {' '.join(info['pv'])} ({info['time']:.2f}s, {', '.join(statistics)})")
+
+# -- Iterative deepening: search at depth 1, 2, 3... until the time budget is exhausted --
+#Each iteration stores its best moves in the transposition table, so the principal variation of the previous iteration is searched first.
+#The move returned is the best move of the last completed iteration.
+def findMoveIterativeDeepening(board, max_depth, time_limit=None, info_callback=None):
+    global search_deadline
+    turnColor = 1 if board.turn == chess.WHITE else -1
+    start_time = time.time()
+    deadline = start_time + time_limit if time_limit is not None else math.inf  #Without time limit, only stop_search ends the search early
+    stack_size = len(board.move_stack)
+    best_move = None
+    start_search_info()
+    transposition_table.new_search()
+    clear_move_ordering_tables()
 
-    maxScore = -1000
+    for depth in range(1, max_depth + 1):
+        search_deadline = deadline if depth > 1 else None  #The first iteration always completes so that a move is available
+        use_aspiration = ASPIRATION_WINDOW is not None and depth >= ASPIRATION_MIN_DEPTH and best_move is not None
+        try:
+            move = search_root(board, depth, turnColor, nextScore if use_aspiration else None)
+        except SearchTimeout:
+            #Undo the moves of the unfinished iteration
+            while len(board.move_stack) > stack_size:
+                board.pop()
+            break
+        if move is None:
+            break
+        best_move = move
+
+        elapsed = time.time() - start_time
+        update_eval_cache_stats()
+        report_iteration(board, depth, nextScore * turnColor, get_principal_variation(board, depth), elapsed, info_callback)
+
+        if abs(nextScore) >= CHECKMATE:
+            break  #A forced mate has been found
+        #The next iteration takes several times longer than this one: do not start it if it cannot finish in time
+        if time_limit is not None and elapsed > time_limit / 2:
+            break
+
+    search_deadline = None
+    return best_move
+
+#Aspiration window: the score of an iteration is usually close to the score of the previous one, so the root is searched with a narrow window around it,
+#which prunes more. If the score falls outside the window (fail low or fail high), the search is repeated with a window widened on that side.
+
+# -- Function that searches the root at a given depth, with an aspiration window around previous_score (None: full window) --
+def search_root(board, depth, turnColor, previous_score=None):
+    alpha, beta = -1000, 1000
+    if previous_score is not None:
+        window = ASPIRATION_WINDOW
+        alpha, beta = max(-1000, previous_score - window), min(1000, previous_score + window)
+    while True:
+        incremental_evaluator.reset(board)
+        move = findMoveNegaMaxAlphaBeta(board, depth, alpha, beta, turnColor)
+        if nextScore <= alpha and alpha > -1000:
+            window *= 4
+            alpha = max(-1000, previous_score - window)
+        elif nextScore >= beta and beta < 1000:
+            window *= 4
+            beta = min(1000, previous_score + window)
+        else:
+            return move
+
+#Parallel search (SEARCH_PROCESSES > 1): Python threads cannot run the search on several cores at the same time, so the root moves are split across processes.
+#At each iteration, the first root move (best move of the previous iteration) is searched with the full window, then the other root moves
+#are searched in parallel with a null window against its score, and searched again with an open window by their worker if they are better.
+#A root move goes to whichever worker is free, so each task starts with an empty transposition table and empty killer moves and history:
+#the score of a root move only depends on the move, the depth and the window, not on the worker or on the moves it searched before.
+#The results are merged in the order of the root moves (the first best score wins). Without time limit, the move and the score are then
+#the same from one run to the next, whatever the order in which the workers finish (they can differ from those of the serial search,
+#which shares its tables between the root moves).
+search_pool = None  #Pool of processes of the parallel search, created at the first parallel search and kept for the next moves
+
+# -- Function that returns the pool of processes of the parallel search --
+def get_search_pool():
+    global search_pool
+    if search_pool is None:
+        search_pool = Pool(SEARCH_PROCESSES, initializer=init_search_worker, initargs=(stop_flag,))
+    return search_pool
+
+# -- Function that stops the processes of the search pool (a new pool is created at the next parallel search) --
+#Needed when the number of processes, the size of the transposition table or the parameters change: the workers keep their own copies.
+def close_search_pool():
+    global search_pool
+    if search_pool is not None:
+        search_pool.terminate()
+        search_pool = None
+
+def init_search_worker(flag):
+    global stop_flag
+    stop_flag = flag
+
+# -- Worker function: searches one root move, returns its score for the side to move at the root (None if the time is over),
+#the number of nodes and the counters of the search of the move --
+#alpha is None for a full window search, otherwise the move is only searched with an open window if it is better than alpha.
+def search_root_move_worker(task):
+    reset_search_stats()
+    score = search_root_move(task)
+    update_eval_cache_stats()
+    return score, search_nodes, dict(search_stats)
+
+def search_root_move(task):
+    global search_deadline
+    board, move, depth, alpha, deadline = task
+    transposition_table.clear()
+    clear_move_ordering_tables()
+    search_deadline = deadline
+    turnColor = 1 if board.turn == chess.WHITE else -1
+    incremental_evaluator.reset(board)
+    push_move(board, move)
+    try:
+        if alpha is None:
+            return -findMoveNegaMaxAlphaBeta(board, depth - 1, -1000, 1000, -turnColor, 1)
+        score = -findMoveNegaMaxAlphaBeta(board, depth - 1, -alpha - NULL_WINDOW, -alpha, -turnColor, 1)
+        if score > alpha:
+            score = -findMoveNegaMaxAlphaBeta(board, depth - 1, -1000, -alpha, -turnColor, 1)
+        return score
+    except SearchTimeout:
+        return None
+
+# -- Iterative deepening with the root moves split across the processes of the search pool --
+def findMoveParallel(board, max_depth, time_limit=None, info_callback=None):
+    global search_nodes
+    turnColor = 1 if board.turn == chess.WHITE else -1
+    start_time = time.time()
+    deadline = start_time + time_limit if time_limit is not None else math.inf  #Without time limit, only stop_search ends the search early
+    pool = get_search_pool()
+    start_search_info()
+    clear_move_ordering_tables()
+    root_moves = list(generate_ordered_moves(board, None, 0))
+    if not root_moves:
+        return None
     best_move = None
 
-    #Correction: pass the parameters into move_ordering
-    moves = sorted(board.legal_moves, key=lambda move: move_ordering(board, move, params), reverse=True)
+    for depth in range(1, max_depth + 1):
+        iteration_deadline = deadline if depth > 1 else None  #The first iteration always completes so that a move is available
+        results = [pool.apply(search_root_move_worker, ((board, root_moves[0], depth, None, iteration_deadline),))]
+        first_score = results[0][0]
+        if first_score is not None:
+            tasks = [(board, move, depth, first_score, iteration_deadline) for move in root_moves[1:]]
+            results += pool.map(search_root_move_worker, tasks, chunksize=1)
+        #The nodes and counters of the workers are added to those of the search
+        for _, nodes, stats in results:
+            search_nodes += nodes
+            search_stats['seldepth'] = max(search_stats['seldepth'], stats['seldepth'])
+            for name in search_stats:
+                if name != 'seldepth':
+                    search_stats[name] += stats[name]
+        scores = [score for score, _, _ in results]
+        if None in scores or len(scores) < len(root_moves):
+            break  #The iteration did not complete: the best move of the previous one is played
+
+        #The best move is the first one with the best score, and the root moves are searched by decreasing score at the next iteration
+        order = sorted(range(len(root_moves)), key=lambda i: -scores[i])
+        root_moves = [root_moves[i] for i in order]
+        best_move, best_score = root_moves[0], scores[order[0]]
+
+        elapsed = time.time() - start_time
+        report_iteration(board, depth, best_score * turnColor, [best_move], elapsed, info_callback)
+
+        if abs(best_score) >= CHECKMATE:
+            break  #A forced mate has been found
+        #The next iteration takes several times longer than this one: do not start it if it cannot finish in time
+        if time_limit is not None and elapsed > time_limit / 2:
+            break
 
-    for move in moves:
-        board.push(move)
-        score = -findMoveNegaMaxAlphaBeta(board, depth - 1, -beta, -alpha, -turnColor)
-        board.pop()
+    return best_move
+
+# -- Function that returns the principal variation (list of moves) stored in the transposition table --
+def get_principal_variation(board, depth):
+    pv_board = board.copy()
+    pv = []
+    for _ in range(depth):
+        move = transposition_table.get_move(zobrist_key(pv_board))
+        if move is None or move not in pv_board.legal_moves:
+            break
+        pv.append(move)
+        pv_board.push(move)
+    return pv
+
+#The incremental evaluator follows the moves played in the search to evaluate the leaves without rescanning the board.
+incremental_evaluator = IncrementalEvaluator()
+
+# -- Functions to play and undo a move in the search (the incremental evaluator follows the board) --
+def push_move(board, move):
+    if EVALUATOR == 'incremental':
+        incremental_evaluator.push(board, move)
+    board.push(move)
+
+def pop_move(board):
+    board.pop()
+    if EVALUATOR == 'incremental':
+        incremental_evaluator.pop()
+
+# -- Function that evaluates a leaf of the search with the selected evaluator (score from White's point of view) --
+def evaluate_leaf(board):
+    if EVALUATOR == 'incremental':
+        score = incremental_evaluator.evaluate(board, params)
+    elif EVALUATOR == 'bitboard':
+        score = evaluate_board_bitboard(board, params)
+    else:
+        return evaluate_board_cached(board)
+    if VERIFY_EVALUATOR:
+        expected = evaluate_board(board, params)
+        assert math.isclose(score, expected, abs_tol=1e-9), f"{EVALUATOR} evaluation {score} differs from evaluate_board {expected} for {board.fen()}"
+    return score
+
+#Quiet moves which caused a beta cutoff are likely to cause one again in the positions searched next:
+#- killer moves: the last two quiet moves which caused a cutoff at the same distance from the root (sibling positions),
+#- history table: for each (from square, to square), the sum of depth * depth of the cutoffs it caused anywhere in the search.
+killer_moves = [[None, None] for _ in range(MAX_PLY)]
+history_table = [0] * 4096
+
+# -- Function that forgets the killer moves and the history of the previous search --
+def clear_move_ordering_tables():
+    for killers in killer_moves:
+        killers[0] = killers[1] = None
+    for i in range(len(history_table)):
+        history_table[i] = 0
+
+# -- Function that records a quiet move which caused a beta cutoff --
+def update_move_ordering_tables(move, depth, ply):
+    killers = killer_moves[ply]
+    if killers[0] != move:
+        killers[1] = killers[0]
+        killers[0] = move
+    history_table[move.from_square * 64 + move.to_square] += depth * depth
+
+# -- MVV-LVA (Most Valuable Victim - Least Valuable Attacker): score of each (victim, attacker) pair of piece types, in hundredths of a pawn --
+def build_mvv_lva_table(params):
+    values = [0] * 7
+    for piece_type, name in PIECE_VALUE_NAMES.items():
+        values[piece_type] = params[name]
+    return [[round(100 * (values[victim] - values[attacker])) for attacker in range(7)] for victim in range(7)]
+
+mvv_lva_table = build_mvv_lva_table(params)
+
+# -- Function that replaces the parameters of the evaluation (the names not used by the evaluation are ignored) --
+#params is updated in place, and everything computed with the previous parameters is forgotten: MVV-LVA table, evaluation cache,
+#transposition table and the workers of the parallel search.
+def set_params(new_params):
+    global mvv_lva_table
+    params.update({name: value for name, value in new_params.items() if name in params})
+    mvv_lva_table = build_mvv_lva_table(params)
+    clear_eval_cache()
+    transposition_table.clear()
+    close_search_pool()
+
+# -- Function that loads the parameters of the evaluation from a JSON file (e.g. trained_parameters.json) --
+def load_params(path):
+    with open(path, 'r') as json_file:
+        set_params(json.load(json_file))
+
+# -- Function that returns the MVV-LVA score of a capture (0 for a promotion without capture) --
+def capture_score(board, move):
+    victim = chess.PAWN if board.is_en_passant(move) else board.piece_type_at(move.to_square)
+    if victim is None:
+        return 0
+    return mvv_lva_table[victim][board.piece_type_at(move.from_square)]
+
+# -- Staged move picker: yields the moves of a node of the search in order, generating each stage only when it is reached --
+#1. transposition table move, 2. winning and equal captures (MVV-LVA) and promotions, 3. killer moves, 4. quiet moves by history, 5. losing captures.
+#When the first moves cause a beta cutoff, the quiet moves are never generated nor sorted.
+def generate_ordered_moves(board, tt_move, ply):
+    if tt_move is not None and board.is_pseudo_legal(tt_move) and board.is_legal(tt_move):
+        yield tt_move
+    else:
+        tt_move = None
+
+    captures = [(capture_score(board, move), move) for move in board.generate_legal_captures() if move != tt_move]
+    own_pawns = board.pawns & board.occupied_co[board.turn]
+    captures += [(0, move) for move in board.generate_legal_moves(own_pawns, chess.BB_BACKRANKS & ~board.occupied) if move != tt_move]
+    captures.sort(key=lambda capture: capture[0], reverse=True)
+    losing_captures = []
+    for score, move in captures:
+        if score < 0:
+            losing_captures.append(move)
+        else:
+            yield move
+
+    killers = [killer for killer in killer_moves[ply]
+               if killer is not None and killer != tt_move and not killer.promotion and board.is_pseudo_legal(killer) and not board.is_capture(killer) and board.is_legal(killer)]
+    yield from killers
+
+    quiets = [move for move in board.generate_legal_moves(chess.BB_ALL, ~board.occupied_co[not board.turn])
+              if not move.promotion and move != tt_move and move not in killers and not board.is_en_passant(move)]
+    quiets.sort(key=lambda move: history_table[move.from_square * 64 + move.to_square], reverse=True)
+    yield from quiets
+
+    yield from losing_captures
+
+#The transposition table stores the result of every searched position, so a position reached again through another move order is not searched twice.
+transposition_table = TranspositionTable(TT_SIZE_MB)
+
+#Reduction of the late moves: grows with the remaining depth and the rank of the move in the ordering (at least 1, leaves at least 1 ply)
+lmr_table = [[max(1, min(depth - 2, int(LMR_BASE + math.log(depth) * math.log(move_number) / LMR_DIVISOR))) if depth > 2 and move_number > 0 else 0
+              for move_number in range(64)] for depth in range(64)]
+
+# -- Optimized NegaMax function with Move Ordering (transposition table move, MVV-LVA, killer moves, history), transposition table,
+#principal variation search, null-move pruning and late-move reductions --
+def findMoveNegaMaxAlphaBeta(board, depth, alpha, beta, turnColor, ply=0):
+    global nextMove, nextScore, search_nodes
+    search_nodes += 1
+    if search_deadline is not None and (stop_flag.value or time.time() >= search_deadline):
+        raise SearchTimeout()
+
+    if depth <= 0:
+        if QUIESCENCE:
+            return quiescence(board, alpha, beta, turnColor, ply)
+        if ply > search_stats['seldepth']:
+            search_stats['seldepth'] = ply
+        return turnColor * evaluate_leaf(board)
+
+    #Look up the position in the transposition table
+    alpha_original = alpha
+    key = zobrist_key(board)
+    tt_move = None
+    entry = transposition_table.probe(key)
+    search_stats['tt_probes'] += 1
+    if entry is not None:
+        search_stats['tt_hits'] += 1
+        tt_depth, tt_flag, tt_score, tt_move = entry
+        #The stored score can be reused if it comes from a search at least as deep (never at the root, which must return a move)
+        if ply > 0 and tt_depth >= depth:
+            if tt_flag == EXACT:
+                return tt_score
+            elif tt_flag == LOWERBOUND:
+                alpha = max(alpha, tt_score)
+            elif tt_flag == UPPERBOUND:
+                beta = min(beta, tt_score)
+            if alpha >= beta:
+                return tt_score
+
+    in_check = board.is_check()
+
+    #Null-move pruning: if the opponent cannot reach beta even when the side to move passes its turn, a real move will do even better.
+    #Not in check, not at a node of the principal variation, not twice in a row, and not in pawn endgames where passing could be
+    #better than any move (zugzwang).
+    if (NULL_MOVE_PRUNING and ply > 0 and depth >= NULL_MOVE_MIN_DEPTH and not in_check and beta - alpha <= NULL_WINDOW
+            and board.move_stack and board.peek() != chess.Move.null()
+            and board.occupied_co[board.turn] & ~(board.pawns | board.kings)):
+        push_move(board, chess.Move.null())
+        score = -findMoveNegaMaxAlphaBeta(board, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + NULL_WINDOW, -turnColor, ply + 1)
+        pop_move(board)
+        if score >= beta:
+            return beta if score >= CHECKMATE else score  #A mate found after a null move is not proven
+
+    maxScore = -1000
+    best_move = None
+
+    #The best move found by a previous search of this position (the principal variation at the root) is tried first
+    for move_number, move in enumerate(generate_ordered_moves(board, tt_move, ply)):
+        #Late-move reduction: quiet moves ordered after the hash move, the good captures and the killers are rarely the best
+        reduction = 0
+        if (LATE_MOVE_REDUCTIONS and depth >= LMR_MIN_DEPTH and move_number >= LMR_MIN_MOVES and not in_check
+                and not move.promotion and not board.is_capture(move) and not board.gives_check(move)):
+            reduction = lmr_table[min(depth, 63)][min(move_number, 63)]
+
+        push_move(board, move)
+        if best_move is None:
+            score = -findMoveNegaMaxAlphaBeta(board, depth - 1, -beta, -alpha, -turnColor, ply + 1)
+        else:
+            score = alpha + 1  #Forces the search at full depth when the move is not reduced
+            if reduction:
+                score = -findMoveNegaMaxAlphaBeta(board, depth - 1 - reduction, -alpha - NULL_WINDOW, -alpha, -turnColor, ply + 1)
+            if score > alpha:
+                if PVS:
+                    #Null window: only proves that the move is not better than alpha, and is searched again with the full window if it is
+                    score = -findMoveNegaMaxAlphaBeta(board, depth - 1, -alpha - NULL_WINDOW, -alpha, -turnColor, ply + 1)
+                    if alpha < score < beta:
+                        score = -findMoveNegaMaxAlphaBeta(board, depth - 1, -beta, -alpha, -turnColor, ply + 1)
+                else:
+                    score = -findMoveNegaMaxAlphaBeta(board, depth - 1, -beta, -alpha, -turnColor, ply + 1)
+        pop_move(board)
 
         if score > maxScore:
             maxScore = score
@@ -156,10 +603,26 @@ def findMoveNegaMaxAlphaBeta(board, depth, alpha, beta, turnColor):
 
         alpha = max(alpha, maxScore)
         if alpha >= beta:
+            search_stats['cutoffs'] += 1
+            if move_number == 0:
+                search_stats['first_move_cutoffs'] += 1
+            if not board.is_capture(move) and not move.promotion:
+                update_move_ordering_tables(move, depth, ply)
             break
+
+    #Store the result with the type of bound it represents
+    if maxScore <= alpha_original:
+        flag = UPPERBOUND
+    elif maxScore >= beta:
+        flag = LOWERBOUND
+    else:
+        flag = EXACT
+    transposition_table.store(key, depth, flag, maxScore, best_move)
         
-    if depth == DEPTH:
+    if ply == 0:
+        nextScore = maxScore
         if best_move is not None:
+            nextMove = best_move
             return best_move
         else:
             # Fallback: return first legal move if something went wrong
@@ -172,37 +635,99 @@ def findMoveNegaMaxAlphaBeta(board, depth, alpha, beta, turnColor):
                 return None
     return maxScore
 
-# -- Move Ordering function using MVV-LVA (Most Valuable Victim - Least Valuable Attacker) --
-def move_ordering(board, move, params):
-    target = board.piece_at(move.to_square)
-    if target:
-        symbol = target.symbol().upper()
-        #Map the piece symbols to the parameter names
-        piece_name_map = {
-            'P': 'pawn_value',
-            'N': 'knight_value',
-            'B': 'bishop_value',
-            'R': 'rook_value',
-            'Q': 'queen_value'
-        }
-        victim_value = params.get(piece_name_map.get(symbol, ''), 0)
-        
-        attacker = board.piece_at(move.from_square)
-        if attacker:
-            symbol_attacker = attacker.symbol().upper()
-            attacker_value = params.get(piece_name_map.get(symbol_attacker, ''), 0)
-        else:
-            attacker_value = 0
-        
-        return victim_value - attacker_value
+#At the horizon, a static evaluation in the middle of an exchange gives wrong results (e.g. the queen has just captured a pawn defended by another pawn).
+#The quiescence search continues with the captures only, until the position is quiet.
+#Stand pat: the side to move is not forced to capture, so the static evaluation is a lower bound of the score.
+
+# -- Quiescence search function (captures ordered by MVV-LVA) --
+def quiescence(board, alpha, beta, turnColor, ply=0):
+    global search_nodes
+    search_nodes += 1
+    if search_deadline is not None and (stop_flag.value or time.time() >= search_deadline):
+        raise SearchTimeout()
+    if ply > search_stats['seldepth']:
+        search_stats['seldepth'] = ply
+
+    in_check = QUIESCENCE_CHECK_EVASIONS and board.is_check()
+    if in_check:
+        #No stand pat in check: every evasion is searched
+        maxScore = -1000
+        moves = list(board.legal_moves)
+        if not moves:
+            return turnColor * evaluate_leaf(board)  #Checkmate
+    else:
+        stand_pat = turnColor * evaluate_leaf(board)
+        if stand_pat >= beta:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+        maxScore = stand_pat
+        moves = list(board.generate_legal_captures())
+
+    moves.sort(key=lambda move: capture_score(board, move), reverse=True)
+
+    for move in moves:
+        #Delta pruning: even winning the captured piece with a margin, this capture cannot raise alpha
+        if not in_check and not move.promotion:
+            victim_type = chess.PAWN if board.is_en_passant(move) else board.piece_type_at(move.to_square)
+            if stand_pat + params[PIECE_VALUE_NAMES[victim_type]] + DELTA_MARGIN <= alpha:
+                continue
 
-    #Non-capturing moves have lower priority
-    return 0
+        push_move(board, move)
+        score = -quiescence(board, -beta, -alpha, -turnColor, ply + 1)
+        pop_move(board)
 
-@lru_cache(maxsize=100000)
-def evaluate_board_cached(fen):
-    board = chess.Board(fen)
-    return evaluate_board(board, params)
+        if score > maxScore:
+            maxScore = score
+        alpha = max(alpha, maxScore)
+        if alpha >= beta:
+            break
+
+    return maxScore
+
+#Evaluation cache of the 'standard' evaluator: a fixed-size table indexed by the Zobrist key of the position, so no FEN string is built
+#and no board is parsed. Each slot holds the key and the score (float32) of the last position stored there, which replaces the previous one.
+#- evaluate_board also depends on the move number (king activity after move 40): the positions after move 40 get another key,
+#- the draws by repetition and by the 50-move rule depend on the moves played, not only on the position. They are never cached: the
+#  position is evaluated without its move history, and the 50-move rule is tested on the live board,
+#- the scores depend on params: the cache is cleared by set_params, and when params was changed in place (checked at the start of each
+#  search and at each miss, not at each lookup).
+#A slot only holds keys whose low bits are its index, so an empty slot holds its index with the lowest bit flipped, which no key can be.
+EVAL_CACHE_SIZE = 1 << 17  #Number of slots (power of 2): 1.5 MB
+LATE_GAME_KEY = 0x9E3779B97F4A7C15  #Combined with the key of the positions after move 40
+EMPTY_EVAL_CACHE_KEYS = np.arange(EVAL_CACHE_SIZE, dtype=np.uint64) ^ np.uint64(1)
+eval_cache_keys = EMPTY_EVAL_CACHE_KEYS.copy()
+eval_cache_scores = np.zeros(EVAL_CACHE_SIZE, dtype=np.float32)
+eval_cache_params = dict(params)  #Parameters the stored scores were computed with
+eval_cache_lookups = 0  #Number of lookups and of positions found since the start of the program
+eval_cache_hits = 0
+
+# -- Function that empties the evaluation cache --
+def clear_eval_cache():
+    global eval_cache_params
+    eval_cache_keys[:] = EMPTY_EVAL_CACHE_KEYS
+    eval_cache_params = dict(params)
+
+# -- Function that clears the evaluation cache if params was changed in place since the scores were stored --
+def check_eval_cache_params():
+    if params != eval_cache_params:
+        clear_eval_cache()
+
+def evaluate_board_cached(board):
+    global eval_cache_lookups, eval_cache_hits
+    if board.halfmove_clock >= 99 and board.can_claim_fifty_moves():
+        return DRAW
+    key = zobrist_key(board)
+    if board.fullmove_number > 40:
+        key ^= LATE_GAME_KEY
+    index = key & (EVAL_CACHE_SIZE - 1)
+    eval_cache_lookups += 1
+    if eval_cache_keys.item(index) == key:
+        eval_cache_hits += 1
+    else:
+        check_eval_cache_params()
+        eval_cache_keys[index] = key
+        eval_cache_scores[index] = evaluate_board(board.copy(stack=False), params)
+    return eval_cache_scores.item(index)  #Rounded to float32 on a miss too, so a score does not depend on the content of the cache
 
 # -- Parametric evaluation function that calculates the score of the position --
 #The parameters are used to adjust the importance of each criterion
@@ -517,4 +1042,5 @@ def play_game():
             print("Invalid choice. Please enter 'y', 'n', or 'startfen'.")
 
 #Start the game
-play_game()
\ No newline at end of file
+if __name__ == '__main__':
+    play_game()
\ No newline at end of file
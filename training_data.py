@@ -0,0 +1,116 @@
+#Compact on-disk format of the training positions (replaces the list of {"fen", "move"} objects of master_moves_data.json).
+#Each position is a fixed-size record of 42 bytes:
+#- board: 32 bytes, one 4-bit code per square (0: empty, 1-6: White pawn to king, 9-14: Black pawn to king), two squares per byte,
+#- turn, castling rights (4 bits: K, Q, k, q) and en passant square (255: none),
+#- halfmove clock and fullmove number (the evaluation uses the move number),
+#- move played by the master: from square + 64 * to square + 4096 * promotion piece type,
+#- result of the game: 2 if White won, 1 for a draw, 0 if Black won (255: unknown).
+#Since all records have the same size, record i is at offset 42 * i: the file is memory-mapped with NumPy
+#and a random sample only reads the records of the sample, without loading the whole file.
+import chess
+import numpy as np
+import json
+import sys
+
+TRAINING_DATA_FILE = 'master_moves_data.bin'
+
+RECORD_DTYPE = np.dtype([
+    ('board', np.uint8, 32),
+    ('turn', np.uint8),
+    ('castling', np.uint8),
+    ('ep_square', np.uint8),
+    ('halfmove_clock', np.uint16),
+    ('fullmove_number', np.uint16),
+    ('move', np.uint16),
+    ('result', np.uint8)
+])
+
+NO_EP_SQUARE = 255
+RESULT_CODES = {'1-0': 2, '1/2-1/2': 1, '0-1': 0}
+NO_RESULT = 255
+
+#Castling rights of the standard starting position, in the order of the 4 bits
+CASTLING_SQUARES = [chess.H1, chess.A1, chess.H8, chess.A8]
+
+# -- Functions to encode and decode a move as a 16-bit integer --
+def encode_move(move):
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+def decode_move(code):
+    code = int(code)
+    promotion = code >> 12
+    return chess.Move(code & 63, (code >> 6) & 63, promotion if promotion else None)
+
+# -- Function that encodes a position, the move played and the result of the game ('1-0', '1/2-1/2', '0-1' or None) into a record --
+def encode_position(board, move, result=None):
+    record = np.zeros((), dtype=RECORD_DTYPE)
+    squares = np.zeros(64, dtype=np.uint8)
+    for square, piece in board.piece_map().items():
+        squares[square] = piece.piece_type | (0 if piece.color == chess.WHITE else 8)
+    record['board'] = squares[0::2] | (squares[1::2] << 4)
+    record['turn'] = 1 if board.turn == chess.WHITE else 0
+    record['castling'] = sum(1 << i for i, square in enumerate(CASTLING_SQUARES) if board.castling_rights & chess.BB_SQUARES[square])
+    #Same en passant square as board.fen(): only when an en passant capture is legal
+    record['ep_square'] = board.ep_square if board.has_legal_en_passant() else NO_EP_SQUARE
+    record['halfmove_clock'] = board.halfmove_clock
+    record['fullmove_number'] = board.fullmove_number
+    record['move'] = encode_move(move)
+    record['result'] = RESULT_CODES.get(result, NO_RESULT)
+    return record
+
+# -- Function that decodes a record into the position (chess.Board) and the move played --
+def decode_position(record):
+    squares = np.empty(64, dtype=np.uint8)
+    squares[0::2] = record['board'] & 15
+    squares[1::2] = record['board'] >> 4
+
+    board = chess.Board.empty()
+    board.set_piece_map({int(square): chess.Piece(int(code) & 7, not code & 8) for square, code in enumerate(squares) if code})
+    board.turn = bool(record['turn'])
+    castling = int(record['castling'])
+    board.castling_rights = 0
+    for i, square in enumerate(CASTLING_SQUARES):
+        if castling & (1 << i):
+            board.castling_rights |= chess.BB_SQUARES[square]
+    ep_square = int(record['ep_square'])
+    board.ep_square = None if ep_square == NO_EP_SQUARE else ep_square
+    board.halfmove_clock = int(record['halfmove_clock'])
+    board.fullmove_number = int(record['fullmove_number'])
+    return board, decode_move(record['move'])
+
+# -- Function that opens the training data (memory-mapped, nothing is read until records are accessed) --
+def load_training_data(path=TRAINING_DATA_FILE):
+    return np.memmap(path, dtype=RECORD_DTYPE, mode='r')
+
+# -- Function that returns the results of the games of the records as the score of White (1, 0.5 or 0, NaN if unknown) --
+def game_results(records):
+    results = np.asarray(records['result'], dtype=np.float64) / 2
+    results[records['result'] == NO_RESULT] = np.nan
+    return results
+
+# -- Function that draws the indices of a random sample of positions (sorted to read the file in order) --
+def sample_indices(training_data, sample_size, seed=None):
+    rng = np.random.default_rng(seed)
+    return np.sort(rng.choice(len(training_data), size=sample_size, replace=False))
+
+# -- Function that draws a random sample of positions, returned as a list of (board, move) --
+def sample_training_data(training_data, sample_size, seed=None):
+    indices = sample_indices(training_data, sample_size, seed)
+    return [decode_position(record) for record in training_data[indices]]
+
+# -- Function to convert a master_moves_data.json file of the previous format (the results of the games are unknown) --
+def convert_json(json_path, path=TRAINING_DATA_FILE):
+    with open(json_path, 'r') as json_file:
+        master_moves_data = json.load(json_file)
+    with open(path, 'wb') as data_file:
+        for data in master_moves_data:
+            board = chess.Board(data['fen'])
+            data_file.write(encode_position(board, board.parse_san(data['move'])).tobytes())
+    return len(master_moves_data)
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print("Usage: python training_data.py master_moves_data.json  (converts the JSON data to master_moves_data.bin)")
+    else:
+        count = convert_json(sys.argv[1])
+        print(f"{count} positions saved to {TRAINING_DATA_FILE}")
@@ -0,0 +1,65 @@
+#Transposition table shared by the NegaMax search of parametric_chess_ai.py and AIChessBoard.py.
+#A same position is often reached through different move orders (e.g. 1.Nf3 Nf6 2.d4 and 1.d4 Nf6 2.Nf3), so the result of its search is stored once and reused.
+#Positions are identified by their 64-bit Zobrist hash (Polyglot keys from python-chess).
+import chess.polyglot
+
+#Type of bound of a stored score
+EXACT = 0  #The score is the exact value of the position
+LOWERBOUND = 1  #The search failed high (beta cutoff): the real score is at least the stored score
+UPPERBOUND = 2  #The search failed low: the real score is at most the stored score
+
+#Approximate memory used by one entry (tuple of key, depth, flag, score, move and age + its slot in the list)
+ENTRY_SIZE = 160
+
+# -- Function to compute the Zobrist key of a position --
+def zobrist_key(board):
+    return chess.polyglot.zobrist_hash(board)
+
+# -- Transposition table with a fixed memory budget --
+#Each bucket holds two entries:
+#- a depth-preferred slot, which keeps the deepest search of the bucket (more expensive to recompute),
+#- an always-replace slot, which keeps the most recent search that could not enter the depth-preferred slot.
+#Entries left by a previous move (older age) are always replaced, so the table does not fill up with stale deep results.
+class TranspositionTable():
+    def __init__(self, size_mb=64):
+        self.resize(size_mb)
+
+    def resize(self, size_mb):
+        self.size_mb = size_mb
+        self.num_buckets = max(1, int(size_mb * 1024 * 1024) // (2 * ENTRY_SIZE))
+        self.clear()
+
+    def clear(self):
+        self.depth_preferred = [None] * self.num_buckets
+        self.always_replace = [None] * self.num_buckets
+        self.age = 0
+
+    # -- Function to call before each new search (entries of older searches become replaceable) --
+    def new_search(self):
+        self.age += 1
+
+    # -- Function that returns (depth, flag, score, move) for the position, or None if it is not stored --
+    def probe(self, key):
+        index = key % self.num_buckets
+        entry = self.depth_preferred[index]
+        if entry is not None and entry[0] == key:
+            return entry[1:5]
+        entry = self.always_replace[index]
+        if entry is not None and entry[0] == key:
+            return entry[1:5]
+        return None
+
+    # -- Function that stores the result of a search --
+    def store(self, key, depth, flag, score, move):
+        index = key % self.num_buckets
+        entry = (key, depth, flag, score, move, self.age)
+        current = self.depth_preferred[index]
+        if current is None or current[0] == key or current[5] != self.age or depth >= current[1]:
+            self.depth_preferred[index] = entry
+        else:
+            self.always_replace[index] = entry
+
+    # -- Function that returns the best move stored for the position, or None --
+    def get_move(self, key):
+        entry = self.probe(key)
+        return entry[3] if entry is not None else None
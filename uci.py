@@ -0,0 +1,184 @@
+#UCI (Universal Chess Interface) front-end of the engine of parametric_chess_ai.py: python uci.py
+#Tournament managers, analysis GUIs and match runners talk to the engine with text commands on the standard input/output:
+#position, go (depth, movetime, wtime/btime/winc/binc/movestogo, infinite), stop, setoption (Hash, Threads, ParamsFile, OwnBook), quit.
+#The search runs in its own thread, so the commands keep being read during the search and stop takes effect immediately.
+#The standard output only carries the protocol: the messages printed by the engine are sent to the error output.
+import json
+import os
+import sys
+import threading
+import chess
+
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+uci_output = sys.stdout
+sys.stdout = sys.stderr  #The engine prints its messages (book moves, moves played...) with print
+import parametric_chess_ai as engine
+
+ENGINE_NAME = 'StrategicChessAI'
+ENGINE_AUTHOR = 'Tr1stan0'
+MAX_HASH_MB = 4096
+
+class UCIEngine():
+    def __init__(self):
+        self.board = chess.Board()
+        self.search_thread = None
+        self.output_lock = threading.Lock()  #The search thread and the command loop both write to the output
+        self.stop_event = threading.Event()  #Set by stop: ends an infinite search
+        self.opening_book = engine.opening_book
+
+    # -- Function that sends a line of the protocol --
+    def send(self, line):
+        with self.output_lock:
+            uci_output.write(line + '\n')
+            uci_output.flush()
+
+    # -- Main loop: reads the commands until quit or the end of the input --
+    def loop(self, input_stream=sys.stdin):
+        for line in input_stream:
+            tokens = line.split()
+            if not tokens:
+                continue
+            command, args = tokens[0], tokens[1:]
+            if command == 'quit':
+                break
+            handler = getattr(self, 'command_' + command, None)
+            if handler is None:
+                print(f"Unknown command: {line.strip()}", file=sys.stderr)
+                continue
+            try:
+                handler(args)
+            except (ValueError, IndexError) as error:
+                print(f"Invalid command '{line.strip()}': {error}", file=sys.stderr)
+        self.stop()
+        engine.close_search_pool()
+
+    def command_uci(self, args):
+        self.send(f"id name {ENGINE_NAME}")
+        self.send(f"id author {ENGINE_AUTHOR}")
+        self.send(f"option name Hash type spin default {engine.TT_SIZE_MB} min 1 max {MAX_HASH_MB}")
+        self.send(f"option name Threads type spin default {engine.SEARCH_PROCESSES} min 1 max {os.cpu_count() or 1}")
+        self.send("option name ParamsFile type string default <empty>")
+        self.send(f"option name OwnBook type check default {'true' if self.opening_book is not None else 'false'}")
+        self.send("uciok")
+
+    def command_isready(self, args):
+        self.send("readyok")
+
+    def command_ucinewgame(self, args):
+        self.stop()
+        engine.transposition_table.clear()
+        if engine.SEARCH_PROCESSES > 1:
+            engine.close_search_pool()  #The workers keep their own tables: the next search starts new workers from the cleared table
+
+    # -- setoption name <name> value <value> (the name and the value can contain spaces) --
+    def command_setoption(self, args):
+        value_index = args.index('value') if 'value' in args else len(args)
+        name = ' '.join(args[1:value_index]).lower()
+        value = ' '.join(args[value_index + 1:])
+        self.stop()
+        if name == 'hash':
+            engine.TT_SIZE_MB = max(1, min(MAX_HASH_MB, int(value)))
+            engine.transposition_table.resize(engine.TT_SIZE_MB)
+            engine.close_search_pool()
+        elif name == 'threads':
+            engine.SEARCH_PROCESSES = max(1, min(os.cpu_count() or 1, int(value)))
+            engine.close_search_pool()
+        elif name == 'paramsfile':
+            if value and value != '<empty>':
+                try:
+                    engine.load_params(value)
+                except (OSError, json.JSONDecodeError) as error:
+                    print(f"Cannot load the parameters of {value}, the previous ones are kept: {error}", file=sys.stderr)
+        elif name == 'ownbook':
+            engine.opening_book = self.opening_book if value.lower() == 'true' else None
+        else:
+            print(f"Unknown option: {name}", file=sys.stderr)
+
+    # -- position [startpos | fen <fen>] [moves <move1> ... <movei>] --
+    def command_position(self, args):
+        moves_index = args.index('moves') if 'moves' in args else len(args)
+        if args[0] == 'startpos':
+            board = chess.Board()
+        elif args[0] == 'fen':
+            board = chess.Board(' '.join(args[1:moves_index]))
+        else:
+            raise ValueError("expected startpos or fen")
+        for uci_move in args[moves_index + 1:]:
+            board.push_uci(uci_move)
+        self.board = board
+
+    # -- go [depth <d>] [movetime <ms>] [wtime <ms>] [btime <ms>] [winc <ms>] [binc <ms>] [movestogo <n>] [infinite] [ponder] --
+    def command_go(self, args):
+        self.stop()
+        options = {}
+        i = 0
+        while i < len(args):
+            if args[i] == 'infinite':
+                options[args[i]] = True
+                i += 1
+            elif args[i] == 'ponder':
+                i += 1  #The Ponder option is not offered: the position is searched as a normal move
+            elif args[i] == 'searchmoves':
+                break  #Not supported: the whole list of moves follows
+            else:
+                options[args[i]] = int(args[i + 1])
+                i += 2
+
+        max_depth = options.get('depth')
+        time_limit = None
+        infinite = options.get('infinite', False)
+        if not infinite:
+            if 'movetime' in options:
+                time_limit = options['movetime'] / 1000
+            elif 'wtime' in options or 'btime' in options:
+                side = 'w' if self.board.turn == chess.WHITE else 'b'
+                time_left = options.get(side + 'time', 0) / 1000
+                increment = options.get(side + 'inc', 0) / 1000
+                time_limit = engine.allocate_time(time_left, increment, options.get('movestogo'))
+            elif max_depth is None:
+                time_limit = engine.TIME_LIMIT
+                max_depth = engine.DEPTH if engine.TIME_LIMIT is None else engine.MAX_DEPTH
+        if max_depth is None:
+            max_depth = engine.MAX_DEPTH
+
+        #The processes of the parallel search are forked here, while no thread reads the input (a process forked while the standard
+        #input is being read would block on it)
+        if engine.SEARCH_PROCESSES > 1:
+            engine.get_search_pool()
+        self.stop_event.clear()
+        self.search_thread = threading.Thread(target=self.search, args=(self.board.copy(), time_limit, max_depth, infinite), daemon=True)
+        self.search_thread.start()
+
+    # -- Search thread: searches the position and sends the best move --
+    #In infinite mode, the best move is only sent after stop, even if the search ends before (forced mate, maximum depth).
+    def search(self, board, time_limit, max_depth, infinite):
+        turn = 1 if board.turn == chess.WHITE else -1
+        move = engine.AI.AI_move(board, time_limit, max_depth, info_callback=lambda info: self.send_info(info, turn))
+        if infinite:
+            self.stop_event.wait()
+        self.send(f"bestmove {move.uci() if move else '0000'}")
+
+    # -- Info callback of the search: one info line per completed iteration --
+    def send_info(self, info, turn):
+        score = info['score'] * turn  #Score for the side to move
+        if abs(score) >= engine.CHECKMATE:
+            moves_to_mate = (len(info['pv_uci']) + 1) // 2
+            score_text = f"mate {moves_to_mate if score > 0 else -moves_to_mate}"
+        else:
+            score_text = f"cp {round(100 * score)}"
+        self.send(f"info depth {info['depth']} seldepth {info['seldepth']} score {score_text} nodes {info['nodes']} "
+                  f"nps {info['nps']} time {int(1000 * info['time'])} pv {' '.join(info['pv_uci'])}")
+
+    def command_stop(self, args):
+        self.stop()
+
+    # -- Function that stops the search and waits for its best move to be sent --
+    def stop(self):
+        self.stop_event.set()
+        while self.search_thread is not None and self.search_thread.is_alive():
+            engine.stop_search()  #Set again until the search ends, in case it had not started yet (a new search resets the flag)
+            self.search_thread.join(0.01)
+        self.search_thread = None
+
+if __name__ == '__main__':
+    UCIEngine().loop()